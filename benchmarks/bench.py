@@ -0,0 +1,458 @@
+"""
+Times the hot paths of the solvers on synthetic manifests and prints the
+results as JSON, eg.
+
+    python benchmarks/bench.py --sizes 50,100,200 --ulds 3,6 --seeds 0,1 --out bench.json
+
+Every (size, ULD count, seed) triple gives the same manifest on every run,
+so the results of two commits can be compared entry by entry.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import importlib.util
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+sys.path.insert(0, os.path.join(ROOT, "greedy"))
+
+from core.genetic import ENGINES, Config, GeneticSolver
+from core.manager import PackageManager
+from metrics_handler import Plan, PlanRequest, plan_metrics, stacked_weights
+from solution import Package, Request, ULD, generate_solution
+from packer import Packer
+
+spec = importlib.util.spec_from_file_location(
+    "generate", os.path.join(ROOT, "pre-screen", "generate.py")
+)
+generate = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(generate)
+
+
+def make_manifest(size, uld_cnt, seed, priority_frac):
+    """
+    Returns the generated packages and ULDs of the manifest
+    """
+    packages = generate.generate_packages(size, seed, priority_frac)
+    ulds = generate.generate_ulds(uld_cnt, seed)
+    return packages, ulds
+
+
+def to_models(packages, ulds):
+    pkgs = [
+        Package(
+            id=f"P-{p['id']}",
+            length=p["length"],
+            width=p["width"],
+            height=p["height"],
+            weight=p["weight"],
+            cost=p["score"],
+            priority=p.get("priority", False),
+        )
+        for p in packages
+    ]
+    containers = [
+        ULD(
+            id=f"U{u['id']}",
+            length=u["length"],
+            width=u["width"],
+            height=u["height"],
+            weight=u["limit"],
+        )
+        for u in ulds
+    ]
+    return pkgs, containers
+
+
+def write_greedy_inputs(packages, ulds, folder):
+    """
+    Writes the manifest in the format loaded by the greedy packer
+    """
+    pack_src = os.path.join(folder, "packages.csv")
+    uld_src = os.path.join(folder, "ulds.csv")
+
+    pd.DataFrame(
+        {
+            "id": [f"P-{p['id']}" for p in packages],
+            "x": [p["length"] for p in packages],
+            "y": [p["width"] for p in packages],
+            "z": [p["height"] for p in packages],
+            "weight": [p["weight"] for p in packages],
+            "priority": [p.get("priority", False) for p in packages],
+            "cost": [p["score"] for p in packages],
+            "fragile": False,
+            "heavy": False,
+            "placed_on_xz": True,
+            "placed_on_xy": True,
+            "placed_on_yz": True,
+        }
+    ).to_csv(pack_src, index=False)
+    pd.DataFrame(
+        {
+            "id": [f"U{u['id']}" for u in ulds],
+            "x": [u["length"] for u in ulds],
+            "y": [u["width"] for u in ulds],
+            "z": [u["height"] for u in ulds],
+            "weight": [u["limit"] for u in ulds],
+        }
+    ).to_csv(uld_src, index=False)
+
+    return pack_src, uld_src
+
+
+def measure(fn, repeat, seed):
+    """
+    Runs `fn` `repeat` times with the random generators seeded the same way
+    every time, and returns the durations and the result of the last run
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        random.seed(seed)
+        np.random.seed(seed)
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def record(results, bench, params, times, **extra):
+    results.append(
+        {
+            "bench": bench,
+            **params,
+            "times": times,
+            "min": min(times),
+            "median": statistics.median(times),
+            **extra,
+        }
+    )
+
+
+def find_fitness(pkgs, ulds, engine, prune_dominated=False):
+    cnfg = Config.of(pkgs, ulds, engine, prune_dominated=prune_dominated)
+    cnfg.initialize()
+    cnfg.find_fitness()
+    return cnfg
+
+
+def run_genetic(pkgs, ulds, engine, generations):
+    solver = GeneticSolver.of(pkgs, ulds, cnt_genes=generations, engine=engine)
+    return solver.run()
+
+
+def solve_within(pkgs, ulds, deadline_ms):
+    req = Request(
+        packages=[pkg.model_dump() for pkg in pkgs],
+        ulds=[uld.model_dump() for uld in ulds],
+        mock=False,
+        deadline_ms=deadline_ms,
+    )
+    return generate_solution(req)[1]
+
+
+def check_deadlines(short, long):
+    """
+    Both solves are seeded the same and evaluate the initial population in
+    the same order, so when the longer one got at least as far, it went
+    through every configuration the shorter one did and cannot end with a
+    worse fitness
+    """
+    if (
+        long["generations"] < short["generations"]
+        or long["evaluations"] < short["evaluations"]
+    ):
+        return
+    if long["fitness"] > short["fitness"]:
+        raise AssertionError(
+            f"The longer deadline ended with the fitness {long['fitness']}, "
+            f"worse than {short['fitness']}"
+        )
+
+
+def loading_order(rows, pkg_cnt, ulds):
+    lis_u = [[uid, uld.length, uld.width, uld.height] for uid, uld in enumerate(ulds)]
+    mng = PackageManager(pkg_cnt, len(ulds), None, lis_u, rows)
+    mng.get_results()
+    return mng
+
+
+def check_blocking(mng):
+    """
+    Every package must be loaded after the packages blocking it
+    """
+    loaded = set()
+    for pid, deps in mng.get_blocking_sets().items():
+        if not loaded.issuperset(deps):
+            raise AssertionError(
+                f"Package {pid} is loaded before {sorted(set(deps) - loaded)}"
+            )
+        loaded.add(pid)
+
+
+def plan_request(rows, pkgs, ulds):
+    return PlanRequest(
+        ulds=[uld.model_dump() for uld in ulds],
+        packages=[
+            {
+                "uld_id": ulds[row[1]].id,
+                "x1": row[2],
+                "y1": row[3],
+                "z1": row[4],
+                "x2": row[5],
+                "y2": row[6],
+                "z2": row[7],
+                "weight": pkgs[row[0]].weight,
+            }
+            for row in rows
+        ],
+    )
+
+
+def loop_moi(items, length, width):
+    """
+    The moment of inertia of one ULD computed package by package, as the
+    metrics were before they were vectorized
+    """
+    volume = 0
+    moment = [0, 0]
+    for x1, y1, z1, x2, y2, z2, _ in items.tolist():
+        size = (x2 - x1) * (y2 - y1) * (z2 - z1)
+        volume += size
+        moment[0] += (x2 + x1) / 2 * size
+        moment[1] += (y2 + y1) / 2 * size
+    if volume != 0:
+        moment = [moment[0] * (1 / volume), moment[1] * (1 / volume)]
+
+    corners = [(0, 0), (length, 0), (0, width), (length, width)]
+    moi_min = 0
+    moi_corners = [0 for _ in corners]
+    for x1, y1, _, x2, y2, _, weight in items.tolist():
+        x, y = (x2 + x1) / 2, (y2 + y1) / 2
+        moi_min += weight * ((x - moment[0]) ** 2 + (y - moment[1]) ** 2)
+        for i, (cx, cy) in enumerate(corners):
+            moi_corners[i] += weight * ((x - cx) ** 2 + (y - cy) ** 2)
+
+    if moi_min == 0:
+        return 0
+    return (np.mean(moi_corners) + np.std(moi_corners)) / moi_min
+
+
+def loop_stacked_weights(items):
+    """
+    The weights stacked on every package, checking all the pairs as the
+    stability metric did before it was vectorized
+    """
+    rows = items.tolist()
+    return [
+        sum(
+            other[6]
+            for other in rows
+            if (
+                other[0] < pkg[3]
+                and other[3] > pkg[0]
+                and other[1] < pkg[4]
+                and other[4] > pkg[1]
+                and other[5] <= pkg[2]
+            )
+        )
+        for pkg in rows
+    ]
+
+
+def check_metrics(req, metrics):
+    """
+    Checks the moment of inertia and the stacked weights of every ULD of
+    the plan against the per package loops, they must be equal
+    """
+    plan = Plan(req)
+    for idx, uld in enumerate(metrics["ulds"]):
+        items = plan.uld_items(idx)
+        length, width = plan.dims[idx, :2].tolist()
+        expected = loop_moi(items, length, width)
+        if uld["moi"] != expected:
+            raise AssertionError(
+                f"moi of {uld['uld_id']} is {uld['moi']}, expected {expected}"
+            )
+        check_stacked_weights(items)
+
+
+def check_stacked_weights(items):
+    if stacked_weights(items).tolist() != loop_stacked_weights(items):
+        raise AssertionError("The stacked weights differ from the all-pairs check")
+
+
+def tall_stacks(size, seed):
+    """
+    Returns a layout of `size` packages in a few columns of stacked boxes,
+    where every package has most of the others of its column below it
+    """
+    rng = np.random.default_rng(seed)
+    columns = max(1, size // 50)
+    rows = []
+    heights = [0.0] * columns
+    for idx in range(size):
+        col = idx % columns
+        x1 = col * 100 + rng.uniform(0, 10)
+        y1 = rng.uniform(0, 10)
+        height = rng.uniform(5, 20)
+        z1 = heights[col]
+        heights[col] += height
+        rows.append([x1, y1, z1, x1 + 80, y1 + 80, z1 + height, rng.uniform(1, 50)])
+    return np.array(rows, dtype=float).reshape(-1, 7)
+
+
+def run_greedy(pack_src, uld_src):
+    with redirect_stdout(io.StringIO()):
+        return Packer(pack_src, uld_src)
+
+
+def bench_manifest(size, uld_cnt, seed, args, results):
+    packages, generated_ulds = make_manifest(size, uld_cnt, seed, args.priority_frac)
+    pkgs, ulds = to_models(packages, generated_ulds)
+    params = {"packages": size, "ulds": uld_cnt, "seed": seed}
+
+    rows = None
+    for engine in args.engines:
+        times, cnfg = measure(
+            lambda: find_fitness(pkgs, ulds, engine), args.repeat, seed
+        )
+        record(
+            results,
+            "config.find_fitness",
+            {**params, "engine": engine},
+            times,
+            placed=len(cnfg.resultant_data),
+            fitness=float(cnfg.fitness_score),
+        )
+        rows = cnfg.resultant_data
+
+        times, pruned = measure(
+            lambda: find_fitness(pkgs, ulds, engine, True), args.repeat, seed
+        )
+        record(
+            results,
+            "config.find_fitness",
+            {**params, "engine": engine, "prune_dominated": True},
+            times,
+            placed=len(pruned.resultant_data),
+            fitness=float(pruned.fitness_score),
+            dominated=pruned.dominated_pts,
+            same_placements=pruned.resultant_data == rows,
+        )
+
+        times, _ = measure(
+            lambda: run_genetic(pkgs, ulds, engine, args.generations),
+            args.repeat,
+            seed,
+        )
+        record(
+            results,
+            "genetic.run",
+            {**params, "engine": engine, "generations": args.generations},
+            times,
+        )
+
+    solves = []
+    for deadline_ms in sorted(args.deadlines):
+        times, stats = measure(lambda: solve_within(pkgs, ulds, deadline_ms), 1, seed)
+        record(
+            results,
+            "solution.deadline",
+            {**params, "deadline_ms": deadline_ms},
+            times,
+            generations=stats["generations"],
+            evaluations=stats["evaluations"],
+            fitness=stats["fitness"],
+        )
+        solves.append(stats)
+    for short, long in zip(solves, solves[1:]):
+        check_deadlines(short, long)
+
+    times, mng = measure(lambda: loading_order(rows, size, ulds), args.repeat, seed)
+    record(results, "manager.get_results", params, times, placed=len(rows))
+    check_blocking(mng)
+
+    req = plan_request(rows, pkgs, ulds)
+    times, metrics = measure(lambda: plan_metrics(req), args.repeat, seed)
+    record(
+        results,
+        "metrics.plan",
+        params,
+        times,
+        placed=len(rows),
+    )
+    check_metrics(req, metrics)
+
+    stacks = tall_stacks(size, seed)
+    times, _ = measure(lambda: stacked_weights(stacks), args.repeat, seed)
+    record(results, "metrics.stacked_weights", params, times, layout="tall_stacks")
+    check_stacked_weights(stacks)
+
+    with tempfile.TemporaryDirectory() as folder:
+        pack_src, uld_src = write_greedy_inputs(packages, generated_ulds, folder)
+        times, packer = measure(
+            lambda: run_greedy(pack_src, uld_src), args.repeat, seed
+        )
+    record(
+        results,
+        "greedy.packer",
+        params,
+        times,
+        placed=packer.best_metrics["packed_cnt"],
+    )
+
+
+def int_list(text):
+    return [int(val) for val in text.split(",") if val]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the solvers")
+    parser.add_argument("--sizes", type=int_list, default=[50, 100, 200])
+    parser.add_argument("--ulds", type=int_list, default=[3, 6])
+    parser.add_argument("--seeds", type=int_list, default=[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--deadlines", type=int_list, default=[300, 3000])
+    parser.add_argument("--priority-frac", type=float, default=0.2)
+    parser.add_argument(
+        "--engines", type=lambda text: text.split(","), default=list(ENGINES)
+    )
+    parser.add_argument("--out", default=None, help="file to write, else stdout")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for uld_cnt in args.ulds:
+            for seed in args.seeds:
+                bench_manifest(size, uld_cnt, seed, args, results)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+    if args.out is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.out, "w") as file:
+            json.dump(report, file, indent=2)
@@ -1,6 +1,26 @@
+import math
+import bisect
 import pandas as pd
 from enum import Enum
 from typing import List
+from collections import defaultdict
+
+# Columns of the package and ULD CSV files, in the order of the constructors
+PACKAGE_COLUMNS = [
+    "id",
+    "x",
+    "y",
+    "z",
+    "weight",
+    "cost",
+    "priority",
+    "fragile",
+    "heavy",
+    "placed_on_xz",
+    "placed_on_xy",
+    "placed_on_yz",
+]
+ULD_COLUMNS = ["id", "x", "y", "z", "weight"]
 
 
 class Package:
@@ -54,8 +74,9 @@ class Package:
             self.orients.append("zyx")
 
         # Sort the orientations based on the base area
+        dims = {"x": x, "y": y, "z": z}
         self.orients.sort(
-            key=lambda x: self.get_dim(x[0]) * self.get_dim(x[1]),
+            key=lambda o: dims[o[0]] * dims[o[1]],
             reverse=True,
         )
 
@@ -103,31 +124,39 @@ class Package:
     def load_from_df(file: str) -> List["Package"]:
         """
         Load packages from a CSV file.
+        The columns are read as whole lists, instead of row by row.
         """
-        df = pd.read_csv(file)
-        packages = []
-
-        for _, row in df.iterrows():
-            packages.append(
-                Package(
-                    row["id"],
-                    row["x"],
-                    row["y"],
-                    row["z"],
-                    row["weight"],
-                    row["cost"],
-                    row["priority"],
-                    row["fragile"],
-                    row["heavy"],
-                    placed_on=[
-                        row["placed_on_xz"],
-                        row["placed_on_xy"],
-                        row["placed_on_yz"],
-                    ],
-                )
+        df = pd.read_csv(file, usecols=PACKAGE_COLUMNS)
+        cols = [df[col].tolist() for col in PACKAGE_COLUMNS]
+
+        return [
+            Package(
+                id,
+                x,
+                y,
+                z,
+                weight,
+                cost,
+                priority,
+                fragile,
+                heavy,
+                placed_on=[on_xz, on_xy, on_yz],
             )
-
-        return packages
+            for (
+                id,
+                x,
+                y,
+                z,
+                weight,
+                cost,
+                priority,
+                fragile,
+                heavy,
+                on_xz,
+                on_xy,
+                on_yz,
+            ) in zip(*cols)
+        ]
 
     def contains(self, x, y, z):
         """
@@ -165,6 +194,176 @@ class Package:
         return dx * dy * dz
 
 
+class GridIndex:
+    def __init__(self, cell_size: float):
+        """
+        A uniform grid over a ULD, storing the index of every placed package
+        in all the cells its box touches. Packages whose boxes overlap share
+        at least one cell, so a collision check only needs the packages found
+        in the cells of the query box.
+        """
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.boxes = {}
+
+    def cell_range(self, pt1, pt2):
+        """
+        Returns the ranges of the cells covered by the box (pt1, pt2) on
+        every axis. A box ending on a cell boundary does not cover the next
+        cell, as touching boxes do not intersect.
+        """
+        cs = self.cell_size
+        return [
+            range(math.floor(lo / cs), math.ceil(hi / cs)) for lo, hi in zip(pt1, pt2)
+        ]
+
+    def insert(self, pack_idx: int, pt1, pt2):
+        self.boxes[pack_idx] = (pt1, pt2)
+        rx, ry, rz = self.cell_range(pt1, pt2)
+        for i in rx:
+            for j in ry:
+                for k in rz:
+                    self.cells[(i, j, k)].append(pack_idx)
+
+    def query(self, pt1, pt2) -> set:
+        """
+        Returns the indices of the packages which may intersect the box
+        (pt1, pt2), ie. the ones sharing a cell with it.
+        """
+        found = set()
+        rx, ry, rz = self.cell_range(pt1, pt2)
+        for i in rx:
+            for j in ry:
+                for k in rz:
+                    cell = self.cells.get((i, j, k))
+                    if cell:
+                        found.update(cell)
+        return found
+
+    def covers(self, pt) -> bool:
+        """
+        Checks if the point is inside a box, counting the lower faces of the
+        box but not the upper ones. A package placed at such a point would
+        intersect the box.
+        """
+        cell = tuple(math.floor(c / self.cell_size) for c in pt)
+        for pack_idx in self.cells.get(cell, ()):
+            pt1, pt2 = self.boxes[pack_idx]
+            if all(lo <= c < hi for c, lo, hi in zip(pt, pt1, pt2)):
+                return True
+        return False
+
+    def support(self, pt, axis: int):
+        """
+        Returns the coordinate on `axis` of the nearest upper face below the
+        point of a box lying across its line along `axis`, or 0 if there is
+        none, ie. where the point stops if moved down along `axis`.
+        """
+        cs = self.cell_size
+        cell = [math.floor(c / cs) for c in pt]
+        found = 0
+
+        for i in range(0, cell[axis] + 1):
+            cell[axis] = i
+            for pack_idx in self.cells.get(tuple(cell), ()):
+                pt1, pt2 = self.boxes[pack_idx]
+                if pt2[axis] <= pt[axis] and pt2[axis] > found:
+                    if all(pt1[k] <= pt[k] < pt2[k] for k in range(3) if k != axis):
+                        found = pt2[axis]
+        return found
+
+    def clear(self):
+        self.cells = defaultdict(list)
+        self.boxes = {}
+
+    def copy(self) -> "GridIndex":
+        other = GridIndex(self.cell_size)
+        for cell, packs in self.cells.items():
+            other.cells[cell] = list(packs)
+        other.boxes = dict(self.boxes)
+        return other
+
+
+class ExtremePoints:
+    def __init__(self, bounds, key=tuple, min_dim=0):
+        """
+        The reference points of a ULD, kept sorted by `key` so that the
+        first point where a package fits is the best one for the heuristic.
+
+        Points which cannot hold any package are not kept: the ones outside
+        of the ULD, or too close to its far walls for the smallest package
+        dimension `min_dim`. Duplicate points are dropped as well.
+        """
+        self.bounds = bounds
+        self.key = key
+        self.min_dim = min_dim
+        self.keys = []
+        self.pts = []
+
+    def __iter__(self):
+        return iter(self.pts)
+
+    def __len__(self):
+        return len(self.pts)
+
+    def __contains__(self, pt):
+        idx = bisect.bisect_left(self.keys, self.key(pt))
+        return idx < len(self.pts) and self.pts[idx] == pt
+
+    def add(self, pt):
+        """
+        Adds the point, unless it cannot hold a package or is already kept.
+        """
+        for c, bound in zip(pt, self.bounds):
+            if c < 0 or c + self.min_dim > bound:
+                return
+
+        key = self.key(pt)
+        idx = bisect.bisect_left(self.keys, key)
+        if idx < len(self.pts) and self.keys[idx] == key:
+            return
+        self.keys.insert(idx, key)
+        self.pts.insert(idx, pt)
+
+    def discard(self, pt):
+        idx = bisect.bisect_left(self.keys, self.key(pt))
+        if idx < len(self.pts) and self.pts[idx] == pt:
+            del self.keys[idx]
+            del self.pts[idx]
+
+    def clear(self):
+        self.keys = []
+        self.pts = []
+
+    def discard_covered(self, pt1, pt2):
+        """
+        Drops the points covered by the box (pt1, pt2), see `GridIndex.covers`.
+        """
+        kept = [
+            idx
+            for idx, pt in enumerate(self.pts)
+            if not all(lo <= c < hi for c, lo, hi in zip(pt, pt1, pt2))
+        ]
+        if len(kept) < len(self.pts):
+            self.keys = [self.keys[idx] for idx in kept]
+            self.pts = [self.pts[idx] for idx in kept]
+
+    def copy(self, key=None) -> "ExtremePoints":
+        """
+        Returns a copy of the points, sorted by `key` if given.
+        """
+        if key is None or key == self.key:
+            other = ExtremePoints(self.bounds, self.key, self.min_dim)
+            other.keys = list(self.keys)
+            other.pts = list(self.pts)
+            return other
+
+        other = ExtremePoints(self.bounds, key, self.min_dim)
+        for pt in self.pts:
+            other.add(pt)
+        return other
+
+
 class ULD:
     def __init__(self, id: str, x: int, y: int, z: int, w: int):
         """
@@ -184,7 +383,14 @@ class ULD:
         self.has_priority = False  # If the ULD has a priority package
 
         # Reference points for the ULD
-        self.ref_pts = [(0, 0, 0)]
+        self.ref_pts = ExtremePoints((x, y, z))
+        self.ref_pts.add((0, 0, 0))
+        self.project_points = False
+
+        # Grid over the packed boxes, with cells of a third of the shortest
+        # side of the ULD, so that the grid has a few cells on every axis
+        # whatever the packages. The packages are not known yet here.
+        self.index = GridIndex(max(1, min(x, y, z) / 3))
 
     def __str__(self):
         return f"ULD {self.id} ({self.x}, {self.y}, {self.z})"
@@ -195,14 +401,12 @@ class ULD:
     def load_from_df(file: str) -> List["ULD"]:
         """
         Load ULDs from a CSV file.
+        The columns are read as whole lists, instead of row by row.
         """
-        df = pd.read_csv(file)
-        ulds = []
-
-        for _, row in df.iterrows():
-            ulds.append(ULD(row["id"], row["x"], row["y"], row["z"], row["weight"]))
+        df = pd.read_csv(file, usecols=ULD_COLUMNS)
+        cols = [df[col].tolist() for col in ULD_COLUMNS]
 
-        return ulds
+        return [ULD(id, x, y, z, weight) for id, x, y, z, weight in zip(*cols)]
 
     def out_of_bounds(self, x, y, z):
         """
@@ -210,20 +414,60 @@ class ULD:
         """
         return x < 0 or y < 0 or z < 0 or x > self.x or y > self.y or z > self.z
 
+    def nearby(self, pt1, pt2) -> set:
+        """
+        Returns the indices of the packed packages which may intersect
+        the box (pt1, pt2).
+        """
+        return self.index.query(pt1, pt2)
+
+    def configure_points(self, key, min_dim=0, project=False):
+        """
+        Sorts the reference points by `key`, and drops the points which are
+        too close to the walls for `min_dim`. With `project`, the corners of
+        the packed packages are also projected onto the boxes below them.
+        """
+        self.project_points = project
+        pts = list(self.ref_pts)
+        self.ref_pts = ExtremePoints(self.ref_pts.bounds, key, min_dim)
+        for pt in pts:
+            self.ref_pts.add(pt)
+
+    def add_point(self, pt):
+        """
+        Adds a reference point, unless it is covered by a packed box.
+        """
+        if not self.index.covers(pt):
+            self.ref_pts.add(pt)
+
     def add_package(self, pack: Package, pack_idx: int, ref_pt, opp_pt):
         """
         Add a package to the ULD.
         """
+        self.index.insert(pack_idx, ref_pt, opp_pt)
 
-        self.ref_pts.remove(ref_pt)
+        # The used point and the points covered by the package are dead
+        self.ref_pts.discard(ref_pt)
+        self.ref_pts.discard_covered(ref_pt, opp_pt)
 
-        # If not fragile, add to the reference points
+        # If not fragile, add the corners of the package to the reference
+        # points, and if enabled their projections onto the nearest boxes
+        # (or walls) below them along the two other axes
         if not pack.fragile:
             opp_x, opp_y, opp_z = opp_pt
             origin_x, origin_y, origin_z = ref_pt
-            self.ref_pts.append((opp_x, origin_y, origin_z))
-            self.ref_pts.append((origin_x, opp_y, origin_z))
-            self.ref_pts.append((origin_x, origin_y, opp_z))
+            for pt, axes in (
+                ((opp_x, origin_y, origin_z), (1, 2)),
+                ((origin_x, opp_y, origin_z), (0, 2)),
+                ((origin_x, origin_y, opp_z), (0, 1)),
+            ):
+                self.add_point(pt)
+                if not self.project_points:
+                    continue
+                for axis in axes:
+                    projected = list(pt)
+                    projected[axis] = self.index.support(pt, axis)
+                    self.add_point(tuple(projected))
 
         # Update the ULD attributes
         self.package_idx.append(pack_idx)
@@ -239,7 +483,63 @@ class ULD:
         self.packed_weight = 0
         self.package_idx = []
         self.has_priority = False
-        self.ref_pts = [(0, 0, 0)]
+        self.ref_pts.clear()
+        self.ref_pts.add((0, 0, 0))
+        self.index.clear()
+
+    def get_state(self) -> tuple:
+        """
+        Returns a copy of the packing state of the ULD.
+        """
+        return (
+            self.packed_volume,
+            self.packed_weight,
+            list(self.package_idx),
+            self.has_priority,
+            self.ref_pts.copy(),
+            self.index.copy(),
+        )
+
+    def set_state(self, state: tuple):
+        """
+        Restores the packing state of the ULD from `get_state`. The state is
+        copied, so that it can be restored again later.
+        """
+        packed_volume, packed_weight, package_idx, has_priority, ref_pts, index = state
+        self.packed_volume = packed_volume
+        self.packed_weight = packed_weight
+        self.package_idx = list(package_idx)
+        self.has_priority = has_priority
+        self.ref_pts = ref_pts.copy(self.ref_pts.key)
+        self.index = index.copy()
+
+
+class PackingState:
+    def __init__(self, packages: List[Package], ulds: List[ULD], cost: float):
+        """
+        A snapshot of a packing: the placement of every package, and the
+        packages, reference points and totals of every ULD, along with the
+        cost of the packing so that snapshots can be compared directly.
+        """
+        self.assigned_uld = [pack.assigned_uld for pack in packages]
+        self.pt1 = [pack.pt1 for pack in packages]
+        self.pt2 = [pack.pt2 for pack in packages]
+        self.ulds = [uld.get_state() for uld in ulds]
+        self.cost = cost
+
+    def restore(self, packages: List[Package], ulds: List[ULD]):
+        """
+        Restores the packing into the packages and ULDs it was taken from.
+        """
+        for pack, uld_idx, pt1, pt2 in zip(
+            packages, self.assigned_uld, self.pt1, self.pt2
+        ):
+            pack.assigned_uld = uld_idx
+            pack.pt1 = pt1
+            pack.pt2 = pt2
+
+        for uld, state in zip(ulds, self.ulds):
+            uld.set_state(state)
 
 
 class FFDecr(Enum):
@@ -267,6 +567,18 @@ class ConstructiveHeuristic(Enum):
     COLUMN = "column"
     WALL = "wall"
 
+    def key(self, pt) -> tuple:
+        """
+        The key of a reference point (x, y, z), lowest first: walls fill
+        z first, layers fill y first and columns fill x first.
+        """
+        x, y, z = pt
+        if self is ConstructiveHeuristic.WALL:
+            return (z, y, x)
+        if self is ConstructiveHeuristic.LAYER:
+            return (y, z, x)
+        return (x, y, z)
+
     def __str__(self):
         return self.value
 
@@ -1,10 +1,23 @@
+import io
+import os
+import math
 import time
 import random
+import itertools
+import numpy as np
 import pandas as pd
 from typing import Optional, List
 from collections import defaultdict
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
 
-from models import Package, ULD, FFDecr, ConstructiveHeuristic
+from models import Package, ULD, PackingState, FFDecr, ConstructiveHeuristic
+
+# Cost of a packing: the cost of every package left out, a penalty for
+# every priority package left out, and a cost for every ULD which holds
+# priority packages
+PENALTY_COST = 10000000
+COST_PER_ULD = 5000
 
 
 class Packer:
@@ -19,10 +32,15 @@ class Packer:
         front_side_support: bool = False,
         package_constraints: Optional[str] = None,
         uld_constraints: Optional[str] = None,
+        project_points: bool = False,
     ):
         """
         Initialize the packer with the packages and ULDs.
+
+        With `project_points`, the reference points added for a package are
+        also projected onto the nearest boxes below them.
         """
+        self.sources = (package_src, uld_src, package_constraints, uld_constraints)
         self.packages: List[Package] = Package.load_from_df(package_src)
         self.ulds: List[ULD] = ULD.load_from_df(uld_src)
 
@@ -36,10 +54,17 @@ class Packer:
         self.optimize_balance = optimize_balance
         self.cpu_limit = cpu_limit
         self.front_side_support = front_side_support
+        self.project_points = project_points
 
         self.pack_constraints = self.load_pack_constraints(package_constraints)
         self.uld_constraints = self.load_uld_constraints(uld_constraints)
 
+        # Keep the reference points sorted for the heuristic, and drop
+        # the ones where even the smallest package side does not fit
+        min_dim = min(min(p.x, p.y, p.z) for p in self.packages)
+        for uld in self.ulds:
+            uld.configure_points(self.heuristic.key, min_dim, project_points)
+
         # Step 1: Fix the order of the packages to process
         # Container order is assumed to be fixed
         self.pack_order = []
@@ -47,6 +72,7 @@ class Packer:
 
         # Step 2: Run the constructive heuristic
         self.constructive_heuristic()
+        self.best_state = self.snapshot()
         self.best_solution = self.generate_solution_dataframe()
         self.best_metrics = self.get_metrics()
 
@@ -93,10 +119,24 @@ class Packer:
         )
         self.pack_order = priority_pkgs + non_priority_pkgs
 
+    def snapshot(self, cost: Optional[float] = None) -> PackingState:
+        """
+        Returns a snapshot of the current packing.
+        """
+        if cost is None:
+            cost = self.get_cost()
+        return PackingState(self.packages, self.ulds, cost)
+
+    def restore(self, state: PackingState):
+        """
+        Restores a packing from a snapshot.
+        """
+        state.restore(self.packages, self.ulds)
+
     def load_solution(self, solution_data):
         """
-        Loads the stored solution into the packer.
-        This method is needed in the improvement heuristic.
+        Loads a solution (eg. from `generate_solution_dataframe`) into the
+        packer, by placing the packages again row by row.
         """
 
         for idx in range(len(self.packages)):
@@ -115,18 +155,32 @@ class Packer:
             )
             self.packages[pack_idx].place_in_uld(uld_idx, (x1, y1, z1), (x2, y2, z2))
 
-    def improve_solution(self, lambda_probability: float):
+    def improve_solution(
+        self, lambda_probability: float, time_limit: Optional[float] = None
+    ) -> dict:
         """
-        Tries to improve on the current solution by repacking the packages.
+        Tries to improve on the current solution by repacking the packages,
+        for `time_limit` seconds (by default half of the CPU limit). No
+        iteration is started which would end past the limit, judging by the
+        slowest iteration so far.
+        Returns the number of iterations and of improvements found.
         """
+        if time_limit is None:
+            time_limit = self.cpu_limit / 2
+
         cur_time = time.time()
         iteration_count = 0
+        improvements = 0
+        slowest = 0
 
-        while time.time() - cur_time < self.cpu_limit / 2:
+        while True:
+            began = time.time()
+            if began - cur_time + slowest >= time_limit:
+                break
             iteration_count += 1
             rnd = random.random()
             if rnd < lambda_probability:
-                self.load_solution(self.best_solution)
+                self.restore(self.best_state)
 
             # Shuffle the packages and the orientations
             random.shuffle(self.pack_order)
@@ -159,16 +213,128 @@ class Packer:
                             removed_packages.remove(pack_idx)
 
             self.constructive_heuristic(removed_packages)
+
+            # Keep the packing if it is the best one so far
+            cost = self.get_cost()
+            if cost < self.best_state.cost:
+                self.best_state = self.snapshot(cost)
+                improvements += 1
+            slowest = max(slowest, time.time() - began)
         print(f"[INFO] Iteration {iteration_count} completed.")
 
+        return {"iterations": iteration_count, "improvements": improvements}
+
     def improvement_heuristic(
         self, lambda_probability: float, gamma_probability: float
     ):
         self.improve_solution(lambda_probability)
 
+        self.restore(self.best_state)
         self.best_solution = self.generate_solution_dataframe()
         self.best_metrics = self.get_metrics()
 
+    def multi_start(
+        self,
+        chains: Optional[int] = None,
+        workers: Optional[int] = None,
+        rounds: int = 4,
+        lambda_probability: float = 0.8,
+        seed: int = 0,
+    ) -> List[dict]:
+        """
+        Runs independent improvement chains in a process pool, for half of
+        the CPU limit in total, which also covers loading the manifest and
+        building the constructive solution of every chain. Every chain starts from the constructive
+        solution of its own package ordering and heuristic, cycling through
+        the combinations of `FFDecr` and `ConstructiveHeuristic`, and has
+        its own random seed.
+
+        The time is split in `rounds`. After every round the best packing
+        of all the chains becomes the incumbent, and the chains whose own
+        best is worse resume from it. The best packing found is loaded into
+        this packer, and the statistics of every chain are returned.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if chains is None:
+            chains = workers
+
+        combos = list(itertools.product(FFDecr, ConstructiveHeuristic))
+        configs = [
+            {
+                "chain": idx,
+                "seed": seed + idx,
+                "first_fit_decr": combos[idx % len(combos)][0],
+                "heuristic": combos[idx % len(combos)][1],
+                "project_points": self.project_points,
+            }
+            for idx in range(chains)
+        ]
+
+        # The chains of a round run in batches if there are fewer workers
+        batches = math.ceil(chains / workers)
+        time_limit = self.cpu_limit / 2 / rounds / batches
+
+        best = [None] * chains
+        rng_states = [None] * chains
+        stats = [
+            {
+                **config,
+                "initial_cost": None,
+                "best_cost": None,
+                "iterations": 0,
+                "improvements": 0,
+                "adopted": 0,
+                "seconds": 0.0,
+            }
+            for config in configs
+        ]
+        incumbent = self.best_state
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for _ in range(rounds):
+                tasks = []
+                for idx, config in enumerate(configs):
+                    start = best[idx]
+                    if start is not None and incumbent.cost < start.cost:
+                        start = incumbent
+                        stats[idx]["adopted"] += 1
+                    tasks.append(
+                        (
+                            config,
+                            self.sources,
+                            start,
+                            rng_states[idx],
+                            time_limit,
+                            lambda_probability,
+                        )
+                    )
+
+                for idx, (state, rng_state, initial_cost, result) in enumerate(
+                    pool.map(_run_chain, tasks)
+                ):
+                    best[idx] = state
+                    rng_states[idx] = rng_state
+                    if stats[idx]["initial_cost"] is None:
+                        stats[idx]["initial_cost"] = initial_cost
+                    stats[idx]["best_cost"] = state.cost
+                    for key in ("iterations", "improvements", "seconds"):
+                        stats[idx][key] += result[key]
+
+                    if state.cost < incumbent.cost:
+                        incumbent = state
+
+        self.best_state = incumbent
+        self.restore(incumbent)
+        self.best_solution = self.generate_solution_dataframe()
+        self.best_metrics = self.get_metrics()
+
+        for chain in stats:
+            chain["first_fit_decr"] = str(chain["first_fit_decr"])
+            chain["heuristic"] = str(chain["heuristic"])
+        self.chain_stats = stats
+        return stats
+
     def add_pack_to_uld(self, packIdx: int, uldIdx: int) -> bool:
         """
         Tries to add a package to a ULD. Returns True if successful.
@@ -189,33 +355,29 @@ class Packer:
         ):
             return False
 
-        min_x = uld.x
-        min_y = uld.y
-        min_z = uld.z
-        candidate_orient = None
-        candidate_corners = None
+        orients = [
+            (orient, [pack.get_dim(ch) for ch in orient]) for orient in pack.orients
+        ]
 
-        # Check all the orientations
-        for orient in pack.orients:
+        # The reference points are sorted by the key of the heuristic, so the
+        # first point where the package fits in some orientation is the best
+        for ref_pt in uld.ref_pts:
+            origin_x, origin_y, origin_z = ref_pt
 
-            # Check all the reference points
-            for ref_pt in uld.ref_pts:
-                origin_x, origin_y, origin_z = ref_pt
+            # Heavy packages should be placed at the bottom
+            if pack.heavy and origin_y > 0:
+                continue
 
-                # Heavy packages should be placed at the bottom
-                if pack.heavy and origin_y > 0:
-                    continue
+            for orient, (dx, dy, dz) in orients:
 
-                corners = Packer.get_coords_based_on_orient(
-                    pack.x, pack.y, pack.z, origin_x, origin_y, origin_z, orient
-                )
-                opp_x, opp_y, opp_z = corners[-1]
+                # Only the origin and the opposite corner are needed
+                opp_x, opp_y, opp_z = origin_x + dx, origin_y + dy, origin_z + dz
                 if uld.out_of_bounds(opp_x, opp_y, opp_z):
                     continue
 
-                # Check for intersection with already placed packages
+                # Check for intersection with the packages placed nearby
                 valid = True
-                for pack_idx in uld.package_idx:
+                for pack_idx in uld.nearby(ref_pt, (opp_x, opp_y, opp_z)):
                     if (
                         self.packages[pack_idx].get_intersection_volume(
                             origin_x, origin_y, origin_z, opp_x, opp_y, opp_z
@@ -230,58 +392,12 @@ class Packer:
                 # TODO: To add bottom area intersection placement condition
                 # TODO: Add front side support condition validation here
 
-                if self.heuristic == ConstructiveHeuristic.WALL:
-                    if (
-                        origin_z < min_z
-                        or (origin_z == min_z and origin_y < min_y)
-                        or (
-                            origin_z == min_z and origin_y == min_y and origin_x < min_x
-                        )
-                    ):
-                        min_x = origin_x
-                        min_y = origin_y
-                        min_z = origin_z
-                        candidate_orient = orient
-                        candidate_corners = corners
-
-                elif self.heuristic == ConstructiveHeuristic.LAYER:
-                    if (
-                        origin_y < min_y
-                        or (origin_y == min_y and origin_z < min_z)
-                        or (
-                            origin_y == min_y and origin_z == min_z and origin_x < min_x
-                        )
-                    ):
-                        min_x = origin_x
-                        min_y = origin_y
-                        min_z = origin_z
-                        candidate_orient = orient
-                        candidate_corners = corners
-
-                elif self.heuristic == ConstructiveHeuristic.COLUMN:
-                    if (
-                        origin_x < min_x
-                        or (origin_x == min_x and origin_y < min_y)
-                        or (
-                            origin_x == min_x and origin_y == min_y and origin_z < min_z
-                        )
-                    ):
-                        min_x = origin_x
-                        min_y = origin_y
-                        min_z = origin_z
-                        candidate_orient = orient
-                        candidate_corners = corners
-
-                else:
-                    raise ValueError(f"Invalid heuristic {self.heuristic}")
-
-        if candidate_orient is None:
-            return False
-
-        uld.add_package(pack, packIdx, candidate_corners[0], candidate_corners[-1])
-        pack.place_in_uld(uldIdx, candidate_corners[0], candidate_corners[-1])
+                opp_pt = (opp_x, opp_y, opp_z)
+                uld.add_package(pack, packIdx, ref_pt, opp_pt)
+                pack.place_in_uld(uldIdx, ref_pt, opp_pt)
+                return True
 
-        return True
+        return False
 
     def constructive_heuristic(
         self, packages: Optional[List[int]] = None, ulds: Optional[List[int]] = None
@@ -317,8 +433,8 @@ class Packer:
         pts = []
         for mask in range(0, 8):
             xn = org_x + (mask & 1) * get(orient[0])
-            yn = org_y + (mask & (1 << 1)) * get(orient[1])
-            zn = org_z + (mask & (1 << 2)) * get(orient[2])
+            yn = org_y + ((mask >> 1) & 1) * get(orient[1])
+            zn = org_z + ((mask >> 2) & 1) * get(orient[2])
 
             pts.append((xn, yn, zn))
 
@@ -327,49 +443,77 @@ class Packer:
     def load_pack_constraints(self, file: Optional[str]) -> dict:
         """
         Load constraints from a CSV file.
+        Every row (id1, id2) keeps the two packages out of the same ULD.
         """
         constraints = defaultdict(lambda: set())
         if file is None:
             return constraints
 
-        df = pd.read_csv(file, columns=["id1", "id2"])
+        df = pd.read_csv(file, usecols=["id1", "id2"])
+        idx1 = self.map_ids(df["id1"], self.package_idx, "Package")
+        idx2 = self.map_ids(df["id2"], self.package_idx, "Package")
 
-        for _, row in df.iterrows():
-            if row["id1"] not in self.package_idx:
-                raise ValueError(f"Package {row['id1']} not found.")
-            if row["id2"] not in self.package_idx:
-                raise ValueError(f"Package {row['id2']} not found.")
-
-            idx1 = self.package_idx[row["id1"]]
-            idx2 = self.package_idx[row["id2"]]
-
-            constraints[idx1].add(idx2)
-            constraints[idx2].add(idx1)
+        # The constraint is symmetric, so both directions are grouped
+        constraints.update(
+            Packer.group_sets(
+                np.concatenate([idx1, idx2]), np.concatenate([idx2, idx1])
+            )
+        )
 
         return constraints
 
     def load_uld_constraints(self, file: Optional[str]) -> dict:
         """
         Load constraints from a CSV file.
+        Every row (pack_id, uld_id) keeps the package out of the ULD.
         """
         constraints = defaultdict(lambda: set())
         if file is None:
             return constraints
 
-        df = pd.read_csv(file, columns=["pack_id", "uld_id"])
+        df = pd.read_csv(file, usecols=["pack_id", "uld_id"])
+        pack_idx = self.map_ids(df["pack_id"], self.package_idx, "Package")
+        uld_idx = self.map_ids(df["uld_id"], self.uld_idx, "ULD")
+        constraints.update(Packer.group_sets(pack_idx, uld_idx))
 
-        for _, row in df.iterrows():
-            if row["pack_id"] not in self.package_idx:
-                raise ValueError(f"Package {row['pack_id']} not found.")
-            if row["uld_id"] not in self.uld_idx:
-                raise ValueError(f"ULD {row['uld_id']} not found.")
+        return constraints
 
-            idx1 = self.package_idx[row["pack_id"]]
-            idx2 = self.uld_idx[row["uld_id"]]
+    def map_ids(self, ids: pd.Series, index: dict, kind: str) -> np.ndarray:
+        """
+        Maps a column of ids to their indices, raising for the first unknown id.
+        """
+        mapped = ids.map(index)
+        missing = mapped.isna()
+        if missing.any():
+            raise ValueError(f"{kind} {ids[missing].iloc[0]} not found.")
+        return mapped.to_numpy(dtype=np.int64)
 
-            constraints[idx1].add(idx2)
+    def group_sets(keys: np.ndarray, values: np.ndarray) -> dict:
+        """
+        Groups the (key, value) pairs by key with a sort, and returns
+        the set of the values of every key.
+        """
+        order = np.argsort(keys, kind="stable")
+        uniq, starts = np.unique(keys[order], return_index=True)
+        values = values[order].tolist()
+        ends = starts[1:].tolist() + [len(values)]
 
-        return constraints
+        return {
+            key: set(values[start:end])
+            for key, start, end in zip(uniq.tolist(), starts.tolist(), ends)
+        }
+
+    def get_cost(self) -> float:
+        """
+        Get the cost of the current packing, lower is better.
+        """
+        cost = 0
+        for pack in self.packages:
+            if pack.assigned_uld is not None:
+                continue
+            cost += PENALTY_COST if pack.priority else pack.cost
+
+        return cost + COST_PER_ULD * sum(1 for uld in self.ulds if uld.has_priority)
 
     def get_metrics(self):
         """
@@ -421,3 +565,60 @@ class Packer:
                 )
 
         return data
+
+
+# Packers of the improvement chains, kept by every worker process so that
+# the manifest is only loaded once per process and chain configuration
+_chain_packers = {}
+
+
+def _run_chain(task):
+    """
+    Runs one round of an improvement chain in a worker process, starting
+    from the given packing (or from the constructive solution of the chain
+    in the first round). The round takes `time_limit` seconds in total, the
+    time spent building the packer of the chain is taken from the
+    improvement. Returns the best packing of the chain, its random state,
+    the cost of its constructive solution and the round statistics.
+    """
+    began = time.time()
+    config, sources, start, rng_state, time_limit, lambda_probability = task
+    package_src, uld_src, package_constraints, uld_constraints = sources
+
+    key = (
+        sources,
+        config["first_fit_decr"],
+        config["heuristic"],
+        config["project_points"],
+    )
+    packer = _chain_packers.get(key)
+    if packer is None:
+        with redirect_stdout(io.StringIO()):
+            packer = Packer(
+                package_src,
+                uld_src,
+                first_fit_decr=config["first_fit_decr"],
+                constructive_heuristic=config["heuristic"],
+                package_constraints=package_constraints,
+                uld_constraints=uld_constraints,
+                project_points=config["project_points"],
+            )
+        packer.initial_state = packer.best_state
+        _chain_packers[key] = packer
+
+    if rng_state is None:
+        random.seed(config["seed"])
+    else:
+        random.setstate(rng_state)
+
+    if start is None:
+        start = packer.initial_state
+    packer.best_state = start
+    packer.restore(start)
+
+    remaining = max(0, time_limit - (time.time() - began))
+    with redirect_stdout(io.StringIO()):
+        result = packer.improve_solution(lambda_probability, remaining)
+    result["seconds"] = time.time() - began
+
+    return packer.best_state, random.getstate(), packer.initial_state.cost, result
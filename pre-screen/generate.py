@@ -1,33 +1,92 @@
 import random
+import argparse
 from csv import DictWriter
 
 NUMBER_PACKAGES = 200
 DIM_LIM = (20, 50)
 WT_LIM = (10, 100)
+SCORE_LIM = (100, 500)
 
-if __name__ == "__main__":
+# Sizes (length, width, height, weight limit) the generated ULDs are drawn from
+ULD_SIZES = [
+    (224, 318, 162, 2500),
+    (244, 318, 244, 2800),
+    (254, 318, 244, 3500),
+]
+
+
+def generate_packages(count=NUMBER_PACKAGES, seed=None, priority_frac=0.0):
+    """
+    Generates `count` random packages, of which about `priority_frac`
+    are priority packages. The same seed gives the same packages.
+    The `priority` column is only added when `priority_frac` is positive,
+    so that the default task files keep their format.
+    """
+    rng = random.Random(seed)
     packages = []
-    total_volume = 0
-    total_weight = 0
 
-    for id in range(1, NUMBER_PACKAGES + 1):
+    for id in range(1, count + 1):
         package = {
             "id": id,
-            "length": random.randint(*DIM_LIM),
-            "width": random.randint(*DIM_LIM),
-            "height": random.randint(*DIM_LIM),
-            "weight": random.randint(*WT_LIM),
-            "score": random.randint(100, 500),
+            "length": rng.randint(*DIM_LIM),
+            "width": rng.randint(*DIM_LIM),
+            "height": rng.randint(*DIM_LIM),
+            "weight": rng.randint(*WT_LIM),
+            "score": rng.randint(*SCORE_LIM),
         }
+        if priority_frac > 0:
+            package["priority"] = rng.random() < priority_frac
         packages.append(package)
 
-        total_volume += package["length"] * package["width"] * package["height"]
-        total_weight += package["weight"]
+    return packages
+
+
+def generate_ulds(count, seed=None):
+    """
+    Generates `count` ULDs of the standard sizes, with their weight
+    limit in the `limit` column as read by validate.py
+    """
+    rng = random.Random(seed)
+    ulds = []
+
+    for id in range(1, count + 1):
+        length, width, height, weight = rng.choice(ULD_SIZES)
+        ulds.append(
+            {
+                "id": id,
+                "length": length,
+                "width": width,
+                "height": height,
+                "limit": weight,
+            }
+        )
+
+    return ulds
 
-    with open("packages.csv", "w", newline="") as file:
-        writer = DictWriter(file, fieldnames=packages[0].keys())
+
+def write_csv(file_name, rows):
+    with open(file_name, "w", newline="") as file:
+        writer = DictWriter(file, fieldnames=rows[0].keys())
         writer.writeheader()
-        writer.writerows(packages)
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a random manifest")
+    parser.add_argument("--packages", type=int, default=NUMBER_PACKAGES)
+    parser.add_argument("--ulds", type=int, default=0, help="also writes uld.csv")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--priority-frac", type=float, default=0.0)
+    args = parser.parse_args()
+
+    packages = generate_packages(args.packages, args.seed, args.priority_frac)
+    write_csv("packages.csv", packages)
+
+    if args.ulds > 0:
+        write_csv("uld.csv", generate_ulds(args.ulds, args.seed))
+
+    total_volume = sum(p["length"] * p["width"] * p["height"] for p in packages)
+    total_weight = sum(p["weight"] for p in packages)
 
     print(f"Total volume: {total_volume}")
     print(f"Total weight: {total_weight}")
@@ -0,0 +1,302 @@
+import json
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+class FitnessCache:
+    """
+    A bounded LRU cache of evaluated configurations, keyed on a hash of the
+    decoded package order. Different key vectors often decode to the same
+    order, and the placement only depends on the order, so those can reuse
+    the fitness score and the placements instead of placing again.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(priority_order, non_priority_order):
+        """
+        Returns the hash of the decoded order of a configuration
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.asarray(priority_order, dtype=np.int64).tobytes())
+        digest.update(b"|")
+        digest.update(np.asarray(non_priority_order, dtype=np.int64).tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        """
+        Returns the (fitness_score, placements) stored for the key,
+        or None if it is not cached
+        """
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, fitness_score, placements):
+        """
+        Stores the result of an evaluation, evicting the least
+        recently used entry if the cache is full
+        """
+        if self.maxsize <= 0:
+            return
+
+        self.entries[key] = (fitness_score, placements)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0
+        return self.hits / lookups
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "size": len(self.entries),
+        }
+
+
+class PrefixCache:
+    """
+    A bounded LRU cache of placement snapshots, keyed on a hash of the prefix
+    of the decoded order which produced them. Two configurations sharing a
+    prefix of their order have identical placement states up to the first
+    difference, so an offspring can resume from the longest prefix already
+    placed by another configuration instead of starting from scratch.
+
+    Snapshots are taken every `interval` packages, and at the end of a phase.
+    """
+
+    def __init__(self, maxsize=256, interval=8):
+        self.maxsize = maxsize
+        self.interval = interval
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def checkpoints(self, tag, base, order, include_start=False):
+        """
+        Returns a dictionary from the prefix lengths of `order` at which
+        snapshots are taken to their keys. The keys also cover the `tag` of
+        the phase and the `base` order placed before the phase starts.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(tag)
+        digest.update(np.asarray(base, dtype=np.int64).tobytes())
+        digest.update(b"|")
+
+        keys = {}
+        if include_start:
+            keys[0] = digest.copy().digest()
+
+        done = 0
+        for k in range(self.interval, len(order), self.interval):
+            digest.update(np.asarray(order[done:k], dtype=np.int64).tobytes())
+            keys[k] = digest.copy().digest()
+            done = k
+
+        digest.update(np.asarray(order[done:], dtype=np.int64).tobytes())
+        keys[len(order)] = digest.digest()
+        return keys
+
+    def longest(self, checkpoints):
+        """
+        Returns (k, snapshot) for the longest prefix among the checkpoints
+        with a stored snapshot, or (0, None) if there is none. An evaluation
+        may look up several phases, so the lookup is counted by `record`.
+        """
+        for k in sorted(checkpoints, reverse=True):
+            snapshot = self.entries.get(checkpoints[k])
+            if snapshot is not None:
+                self.entries.move_to_end(checkpoints[k])
+                return k, snapshot
+
+        return 0, None
+
+    def record(self, hit, skipped=0):
+        """
+        Counts the lookups of one evaluation as a hit skipping `skipped`
+        packages, or as a miss
+        """
+        if hit:
+            self.hits += 1
+            self.skipped += skipped
+        else:
+            self.misses += 1
+
+    def put(self, key, snapshot):
+        """
+        Stores a snapshot, evicting the least recently used
+        entry if the cache is full
+        """
+        if self.maxsize <= 0 or key in self.entries:
+            return
+
+        self.entries[key] = snapshot
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped_packages": self.skipped,
+            "size": len(self.entries),
+        }
+
+
+def sort_columns(columns):
+    """
+    Returns the columns with their rows sorted by the `id` column
+    """
+    order = sorted(range(len(columns["id"])), key=columns["id"].__getitem__)
+    return {field: [values[i] for i in order] for field, values in columns.items()}
+
+
+class SolutionCache:
+    """
+    A bounded LRU cache of solved requests, keyed on a canonical hash of the
+    packages, the ULDs and the solver parameters, so that the same manifest
+    is only solved once. The packages and the ULDs are sorted by their ids
+    first, which makes the key independent of the order they are sent in.
+
+    If `path` is given the solutions are also written to an SQLite database
+    there, which keeps them across restarts. The database holds at most
+    `disk_size` solutions and drops the least recently used ones.
+    """
+
+    def __init__(self, maxsize=128, path=None, disk_size=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.db = None
+        self.disk_size = disk_size
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS solutions "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used INTEGER NOT NULL)"
+            )
+            self.db.commit()
+
+    @staticmethod
+    def key(packages, ulds, params):
+        """
+        Returns the hash of a request, given its packages and ULDs as
+        dictionaries from the field names to the columns, and the
+        parameters the solver is run with. The rows are sorted by id, so
+        the order they are sent in does not matter.
+        """
+        canonical = json.dumps(
+            {
+                "packages": sort_columns(packages),
+                "ulds": sort_columns(ulds),
+                "params": params,
+            },
+            sort_keys=True,
+        )
+        return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the solution stored for the key, or None if it is not cached
+        """
+        with self.lock:
+            solution = self.entries.get(key)
+            if solution is not None:
+                self.entries.move_to_end(key)
+            elif self.db is not None:
+                row = self.db.execute(
+                    "SELECT value FROM solutions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    solution = json.loads(row[0])
+                    self.remember(key, solution)
+
+            if solution is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            if self.db is not None:
+                self.db.execute(
+                    "UPDATE solutions SET used = (SELECT MAX(used) FROM solutions) + 1 "
+                    "WHERE key = ?",
+                    (key,),
+                )
+                self.db.commit()
+            return solution
+
+    def remember(self, key, solution):
+        """
+        Stores the solution in memory, evicting the least
+        recently used entry if the cache is full
+        """
+        if self.maxsize <= 0:
+            return
+
+        self.entries[key] = solution
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def put(self, key, solution):
+        """
+        Stores the solution of a request, in memory and on disk
+        """
+        with self.lock:
+            self.remember(key, solution)
+            if self.db is None:
+                return
+
+            self.db.execute(
+                "INSERT OR REPLACE INTO solutions VALUES "
+                "(?, ?, (SELECT COALESCE(MAX(used), 0) FROM solutions) + 1)",
+                (key, json.dumps(solution)),
+            )
+            self.db.execute(
+                "DELETE FROM solutions WHERE key NOT IN "
+                "(SELECT key FROM solutions ORDER BY used DESC LIMIT ?)",
+                (self.disk_size,),
+            )
+            self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0
+        return self.hits / lookups
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "size": len(self.entries),
+        }
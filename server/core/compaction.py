@@ -0,0 +1,104 @@
+import math
+import bisect
+
+
+class AxisSweep:
+    """
+    Pushes boxes along one axis of the ULDs, either towards the origin or
+    away from it, against the boxes which are already pushed.
+
+    The pushed boxes of every ULD are kept sorted by the face that blocks
+    the next box (the far face when pushing towards the origin, the near
+    face otherwise), so the nearest blocking face is found with one scan of
+    the sorted projections instead of sliding the box one unit at a time.
+    The final positions are the same as with the unit steps, ie. the box
+    stops at the last whole step before the first collision.
+    """
+
+    def __init__(self, dims, axis, towards_zero):
+        """
+        `dims` holds the (length, width, height) of every ULD
+        """
+        self.dims = dims
+        self.axis = axis
+        self.others = [i for i in range(3) if i != axis]
+        self.towards_zero = towards_zero
+
+        self.keys = [[] for _ in range(len(dims))]
+        self.boxes = [[] for _ in range(len(dims))]
+
+    def insert(self, uid, p0, p1):
+        """
+        Adds the pushed box (p0, p1) to the ULD `uid`
+        """
+        if self.towards_zero:
+            key = -p1[self.axis]
+        else:
+            key = p0[self.axis]
+
+        idx = bisect.bisect_right(self.keys[uid], key)
+        self.keys[uid].insert(idx, key)
+        self.boxes[uid].insert(idx, (tuple(p0), tuple(p1)))
+
+    def overlaps_across(self, p0, p1, b0, b1):
+        """
+        Checks if the boxes overlap on the two axes other than the push axis
+        """
+        for i in self.others:
+            if min(p1[i], b1[i]) - max(p0[i], b0[i]) <= 0:
+                return False
+        return True
+
+    def first_collision(self, uid, p0, p1):
+        """
+        Returns the number of unit steps after which the box (p0, p1)
+        first collides, or None if it never does
+        """
+        ax = self.axis
+        s = p0[ax]
+        a = p1[ax] - p0[ax]
+        limit = self.dims[uid][ax]
+
+        # A box sticking out of the ULD on the other axes collides at once
+        for i in self.others:
+            if p1[i] > self.dims[uid][i]:
+                return 1
+
+        if self.towards_zero:
+            if 1 < s + a - limit:
+                return 1
+            for b0, b1 in self.boxes[uid]:
+                k = max(1, math.floor(s - b1[ax]) + 1)
+                if k < s - b0[ax] + a and self.overlaps_across(p0, p1, b0, b1):
+                    # The boxes are sorted by decreasing far faces, so the
+                    # steps needed are non decreasing from here on
+                    return k
+            return None
+
+        best = max(1, math.floor(limit - s - a) + 1)
+        for b0, b1 in self.boxes[uid]:
+            k = max(1, math.floor(b0[ax] - a - s) + 1)
+            if k >= best:
+                break
+            if k < b1[ax] - s and self.overlaps_across(p0, p1, b0, b1):
+                return k
+        return best
+
+    def push(self, uid, p0, p1):
+        """
+        Returns the new start of the box (p0, p1) along the push axis
+        """
+        s = p0[self.axis]
+        if self.towards_zero:
+            steps = math.ceil(s) if s > 0 else 0
+        else:
+            limit = self.dims[uid][self.axis]
+            steps = max(0, math.ceil(limit - s) - 1)
+
+        k = self.first_collision(uid, p0, p1)
+        if k is not None and k <= steps:
+            steps = k - 1
+
+        if self.towards_zero:
+            return s - steps
+        return s + steps
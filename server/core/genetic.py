@@ -1,64 +1,103 @@
-import copy
+import time
 import random
+import itertools
 import numpy as np
 import pandas as pd
 from typing import List
+from concurrent.futures import ProcessPoolExecutor
 
+from core.cache import FitnessCache, PrefixCache
+from core.compaction import AxisSweep
+from core.placement import best_candidate, directs
+from core.points import RefPointStore
+from core.problem import ProblemContext
+from core.profiler import Profiler
+from core.spatial import SpatialIndex
+from core.store import PlacementStore
 
 PENALTY_COST = 10000000
 COST_PER_ULD = 5000
 
+# Engines available to evaluate the candidate placements of a package
+ENGINES = ("python", "numpy")
 
-def check_intersection_cuboids(a0, a1, b0, b1):
-    dx = min(a1[0], b1[0]) - max(a0[0], b0[0])
-    dy = min(a1[1], b1[1]) - max(a0[1], b0[1])
-    dz = min(a1[2], b1[2]) - max(a0[2], b0[2])
-    if dx <= 0 or dy <= 0 or dz <= 0:
-        return False
-    return True
+# Search modes of the genetic solver, and the default population sizes
+MODES = ("classic", "brkga")
+POP_SIZES = {"classic": 2, "brkga": 30}
 
 
-directs = [
-    [0, 0, 0],
-    [0, 0, 0],
-    [0, -1, 0],
-    [-1, 0, 0],
-    [-1, -1, 0],
-    [0, 0, -1],
-    [0, -1, -1],
-    [-1, 0, -1],
-    [-1, -1, -1],
-]
+class Config:
+    """
+    A configuration of the genetic solver: the random keys ordering the
+    priority and the economy packages, and the placements they decode to.
+    Everything else about the problem is read from the shared `problem`,
+    see `ProblemContext`.
+    """
 
+    def __init__(
+        self,
+        problem,
+        engine="numpy",
+        snapshots=None,
+        profiler=None,
+        prune_dominated=False,
+    ):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown placement engine {engine}")
 
-class Config:
-    def __init__(self, all_pkgs, all_ulds):
         self.priority_order = []
         self.non_priority_order = []
         self.enc_priority_ord = []
         self.enc_non_priority_ord = []
         self.fitness_score = -1
         self.packages_placed = 0
-        self.resultant_data = []
         self.priority_packed = 0
         self.non_priority_packed = 0
         self.ulds_used_for_priority = 0
         self.evaluated = False
-        self.uld_wts = []
-
-        self.all_pkgs = all_pkgs
-        self.all_ulds = all_ulds
+        self.pruned_pts = 0
+        self.dominated_pts = 0
+
+        self.problem = problem
+        self.engine = engine
+        self.snapshots = snapshots
+        self.prune_dominated = prune_dominated
+        self.profiler = profiler if profiler is not None else Profiler()
+
+        # Placements of the packages, and a grid over the placed boxes
+        # which is kept in sync with them. Both are only allocated when
+        # the configuration is evaluated, as many offspring reuse the
+        # result of an earlier evaluation.
+        self.placements = None
+        self.index = None
+
+    @staticmethod
+    def of(
+        all_pkgs,
+        all_ulds,
+        engine="numpy",
+        snapshots=None,
+        profiler=None,
+        prune_dominated=False,
+    ):
+        """
+        Returns a configuration of a problem of its own
+        """
+        problem = ProblemContext.of(all_pkgs, all_ulds)
+        return Config(problem, engine, snapshots, profiler, prune_dominated)
 
-        # Calculate other parameters
-        self.count_priority_pkg = sum([pkg.priority for pkg in all_pkgs])
-        self.count_non_priority_pkg = len(all_pkgs) - self.count_priority_pkg
-        self.priority_idx = [i for i, pkg in enumerate(all_pkgs) if pkg.priority]
-        self.non_priority_idx = [
-            i for i, pkg in enumerate(all_pkgs) if not pkg.priority
-        ]
+    @property
+    def resultant_data(self):
+        """
+        The placements as [pid, uid, x1, y1, z1, x2, y2, z2] rows
+        """
+        if self.placements is None:
+            return []
+        return self.placements.rows()
 
-        for _ in range(len(all_ulds)):
-            self.uld_wts.append(0)
+    @property
+    def uld_wts(self):
+        return self.placements.weights
 
     def initialize(self):
         """
@@ -67,26 +106,26 @@ class Config:
         self.enc_priority_ord = np.random.uniform(
             low=0.0,
             high=1.0,
-            size=self.count_priority_pkg,
+            size=self.problem.count_priority_pkg,
         )
         self.enc_non_priority_ord = np.random.uniform(
             low=0.0,
             high=1.0,
-            size=self.count_non_priority_pkg,
+            size=self.problem.count_non_priority_pkg,
         )
 
     def decode(self):
         """
         Decodes the encoded values to get the order of the packages
         """
-        relative_p_order = np.argsort(self.enc_priority_ord)
-        relative_non_p_order = np.argsort(self.enc_non_priority_ord)
-
-        for i in relative_p_order:
-            self.priority_order.append(self.priority_idx[i])
+        with self.profiler.timer("decode"):
+            relative_p_order = np.argsort(self.enc_priority_ord)
+            relative_non_p_order = np.argsort(self.enc_non_priority_ord)
 
-        for i in relative_non_p_order:
-            self.non_priority_order.append(self.non_priority_idx[i])
+            self.priority_order = self.problem.priority_idx[relative_p_order].tolist()
+            self.non_priority_order = self.problem.non_priority_idx[
+                relative_non_p_order
+            ].tolist()
 
     def print_config(self):
         """
@@ -104,46 +143,31 @@ class Config:
         Resets the ULD points, so that the packages can be placed again
         from the start
         """
-        uld_pts = []
-        for i in range(len(self.all_ulds)):
-            uld_pts.append([])
-
-        for obj in self.resultant_data:
-            uid = obj[1]
-            a = obj[5] - obj[2]
-            b = obj[6] - obj[3]
-            c = obj[7] - obj[4]
-            x = obj[2]
-            y = obj[3]
-            z = obj[4]
-            args = [
-                [0, 0, 0],
-                [a, 0, 0],
-                [0, b, 0],
-                [0, 0, c],
-                [a, b, 0],
-                [a, 0, c],
-                [0, b, c],
-                [a, b, c],
-            ]
-
-            for i in range(8):
-                num = i + 1
-                for j in range(8):
-                    uld_pts[uid].append(
-                        [x + args[j][0], y + args[j][1], z + args[j][2], num]
-                    )
+        uld_pts = RefPointStore(
+            self.problem.uld_sizes, self.index, self.prune_dominated
+        )
+
+        for _, uid, p0, p1 in self.placements.items():
+            self.add_point(
+                uid,
+                p0[0],
+                p0[1],
+                p0[2],
+                p1[0] - p0[0],
+                p1[1] - p0[1],
+                p1[2] - p0[2],
+                uld_pts,
+            )
 
-        for obj in self.all_ulds:
-            uid = obj.id
-            uld_pts[uid].append([0, 0, 0, 1])
-            uld_pts[uid].append([obj.length, 0, 0, 3])
-            uld_pts[uid].append([0, obj.width, 0, 2])
-            uld_pts[uid].append([obj.length, obj.width, 0, 4])
-            uld_pts[uid].append([0, 0, obj.height, 5])
-            uld_pts[uid].append([obj.length, 0, obj.height, 7])
-            uld_pts[uid].append([0, obj.width, obj.height, 6])
-            uld_pts[uid].append([obj.length, obj.width, obj.height, 8])
+        for uid, (length, width, height) in enumerate(self.problem.uld_sizes):
+            uld_pts.add(uid, (0, 0, 0, 1))
+            uld_pts.add(uid, (length, 0, 0, 3))
+            uld_pts.add(uid, (0, width, 0, 2))
+            uld_pts.add(uid, (length, width, 0, 4))
+            uld_pts.add(uid, (0, 0, height, 5))
+            uld_pts.add(uid, (length, 0, height, 7))
+            uld_pts.add(uid, (0, width, height, 6))
+            uld_pts.add(uid, (length, width, height, 8))
 
         return uld_pts
 
@@ -166,9 +190,7 @@ class Config:
         for i in range(8):
             num = i + 1
             for j in range(8):
-                uld_pts[uid].append(
-                    [x + args[j][0], y + args[j][1], z + args[j][2], num]
-                )
+                uld_pts.add(uid, (x + args[j][0], y + args[j][1], z + args[j][2], num))
 
     def final_checker(self, uid, pt_of_place, orientation, pid):
         """
@@ -181,526 +203,332 @@ class Config:
         - True if the package can be placed
         - False if the package cannot be placed
         """
-
-        if (
-            self.uld_wts[uid] + self.all_pkgs[pid].weight
-            > (self.all_ulds[uid]).capacity
-        ):
+        problem = self.problem
+        if self.uld_wts[uid] + problem.weights[pid] > problem.capacity[uid]:
             return False
-        if pt_of_place[0] + orientation[0] > self.all_ulds[uid].length:
+
+        length, width, height = problem.uld_sizes[uid]
+        if pt_of_place[0] + orientation[0] > length:
             return False
-        if pt_of_place[1] + orientation[1] > self.all_ulds[uid].width:
+        if pt_of_place[1] + orientation[1] > width:
             return False
-        if pt_of_place[2] + orientation[2] > self.all_ulds[uid].height:
+        if pt_of_place[2] + orientation[2] > height:
             return False
 
-        for ele in self.resultant_data:
-            if ele[1] == uid:
-                second_pt = [
-                    pt_of_place[0] + orientation[0],
-                    pt_of_place[1] + orientation[1],
-                    pt_of_place[2] + orientation[2],
-                ]
-                if check_intersection_cuboids(
-                    pt_of_place,
-                    second_pt,
-                    [ele[2], ele[3], ele[4]],
-                    [ele[5], ele[6], ele[7]],
-                ):
-                    return False
+        second_pt = [
+            pt_of_place[0] + orientation[0],
+            pt_of_place[1] + orientation[1],
+            pt_of_place[2] + orientation[2],
+        ]
+        self.profiler.count("collision_checks")
+        if self.index.intersects(uid, pt_of_place, second_pt):
+            return False
 
         return True
 
-    def place_priority(self, uld_pts):
+    def find_candidate_python(self, pid, uld_pts, by_free_weight):
         """
-        Places all the priority packages in the ULDs
-        specified by the ULD points in the priority order
-        """
-        for it in range(len(self.priority_order)):
-            pid = (self.priority_order)[it]
-            pckg = self.all_pkgs[pid]
-            poss_pts = []
-            a = pckg.length
-            b = pckg.width
-            c = pckg.height
-            orient = [[a, b, c], [a, c, b], [b, a, c], [b, c, a], [c, a, b], [c, b, a]]
-
-            for num in range(len(self.all_ulds)):
-                uid = self.all_ulds[num]
-                for ref_pt in uld_pts[uid]:
-                    xx, yy, zz, dir_idx = ref_pt[0]
-
-                    for args in orient:
-                        xx = ref_pt[0] + (args[0] * directs[dir_idx][0])
-                        yy = ref_pt[1] + (args[1] * directs[dir_idx][1])
-                        zz = ref_pt[2] + (args[2] * directs[dir_idx][2])
-                        if xx < 0 or yy < 0 or zz < 0:
-                            continue
-
-                        if self.final_checker(
-                            uid, [xx, yy, zz], [args[0], args[1], args[2]], pid
-                        ):
-                            poss_pts.append(
-                                [
-                                    pid,
-                                    uid,
-                                    xx,
-                                    yy,
-                                    zz,
-                                    args[0],
-                                    args[1],
-                                    args[2],
-                                    dir_idx,
-                                ]
-                            )
-
-            poss_pts = sorted(
-                poss_pts,
-                key=lambda x: (
-                    -(len(uld_pts[x[1]])),
-                    x[4],
-                    (
-                        abs(
-                            min(x[2], (self.all_ulds[x[1]].length - x[2] - x[5]))
-                            + min(x[3], (self.all_ulds[x[1]].width - x[3] - x[6]))
+        Finds the best placement for the package by checking every
+        reference point and orientation one at a time
+        """
+        problem = self.problem
+        poss_pts = []
+        orient = problem.orientations[pid]
+
+        for uid in range(problem.uld_cnt):
+            self.profiler.count("ref_points_scanned", len(uld_pts[uid]))
+            for ref_pt in uld_pts[uid]:
+                dir_idx = ref_pt[3]
+
+                for args in orient:
+                    xx = ref_pt[0] + (args[0] * directs[dir_idx][0])
+                    yy = ref_pt[1] + (args[1] * directs[dir_idx][1])
+                    zz = ref_pt[2] + (args[2] * directs[dir_idx][2])
+                    if xx < 0 or yy < 0 or zz < 0:
+                        continue
+
+                    if self.final_checker(
+                        uid, [xx, yy, zz], [args[0], args[1], args[2]], pid
+                    ):
+                        poss_pts.append(
+                            [
+                                pid,
+                                uid,
+                                xx,
+                                yy,
+                                zz,
+                                args[0],
+                                args[1],
+                                args[2],
+                                dir_idx,
+                                ref_pt,
+                            ]
                         )
-                    ),
-                    (x[2] * x[2] + x[3] * x[3] + x[4] * x[4]),
+
+        if by_free_weight:
+            primary = lambda x: -(problem.capacity[x[1]] - (self.uld_wts)[x[1]])
+        else:
+            primary = lambda x: -(len(uld_pts[x[1]]))
+
+        sizes = problem.uld_sizes
+        poss_pts = sorted(
+            poss_pts,
+            key=lambda x: (
+                primary(x),
+                x[4],
+                (
+                    abs(
+                        min(x[2], (sizes[x[1]][0] - x[2] - x[5]))
+                        + min(x[3], (sizes[x[1]][1] - x[3] - x[6]))
+                    )
                 ),
-            )
+                (x[2] * x[2] + x[3] * x[3] + x[4] * x[4]),
+            ),
+        )
 
-            if len(poss_pts) == 0:
-                continue
-            else:
-                # Update the resultant data and the reference points
-                # for the next package
-                self.resultant_data.append(
-                    [
-                        poss_pts[0][0],
-                        poss_pts[0][1],
-                        poss_pts[0][2],
-                        poss_pts[0][3],
-                        poss_pts[0][4],
-                        poss_pts[0][2] + poss_pts[0][5],
-                        poss_pts[0][3] + poss_pts[0][6],
-                        poss_pts[0][4] + poss_pts[0][7],
-                    ]
-                )
+        if len(poss_pts) == 0:
+            return None
+        return poss_pts[0]
 
-                self.uld_wts[poss_pts[0][1]] += pckg.weight
-
-                x_t = poss_pts[0][2] - poss_pts[0][5] * directs[poss_pts[0][8]][0]
-                y_t = poss_pts[0][3] - poss_pts[0][6] * directs[poss_pts[0][8]][1]
-                z_t = poss_pts[0][4] - poss_pts[0][7] * directs[poss_pts[0][8]][2]
-
-                # Remove the used reference points
-                uld_pts[poss_pts[0][1]].remove([x_t, y_t, z_t, poss_pts[0][8]])
-
-                # Add 3 more reference points
-                self.add_point(
-                    poss_pts[0][1],
-                    x_t,
-                    y_t,
-                    z_t,
-                    poss_pts[0][5],
-                    poss_pts[0][6],
-                    poss_pts[0][7],
-                    uld_pts,
-                )
+    def find_candidate_numpy(self, pid, uld_pts, by_free_weight):
+        """
+        Finds the best placement for the package by evaluating all the
+        reference points and orientations as one batch of arrays
+        """
+        problem = self.problem
+        uld_wts = self.uld_wts
 
-    def place_economy(self, uld_pts):
+        if by_free_weight:
+            primary = [-(cap - wt) for cap, wt in zip(problem.capacity, uld_wts)]
+        else:
+            primary = [-(len(uld_pts[i])) for i in range(problem.uld_cnt)]
+
+        return best_candidate(
+            pid,
+            problem.dims[pid],
+            problem.weights[pid],
+            uld_pts,
+            problem.uld_dims,
+            uld_wts,
+            problem.capacity,
+            [self.index.box_array(i) for i in range(problem.uld_cnt)],
+            primary,
+            self.profiler,
+            problem.orient_arrays[pid],
+        )
+
+    def find_candidate(self, pid, uld_pts, by_free_weight):
         """
-        Places all the non-priority packages in the ULDs
-        specified by the ULD points in the non-priority order
-        """
-        for it in range(len(self.non_priority_order)):
-            pid = self.non_priority_order[it]
-            pckg = self.all_pkgs[pid]
-            poss_pts = []
-            a = pckg.length
-            b = pckg.width
-            c = pckg.height
-            orient = [[a, b, c], [a, c, b], [b, a, c], [b, c, a], [c, a, b], [c, b, a]]
-
-            for num in range(len(self.all_ulds)):
-                uid = self.all_ulds[num]
-                for ref_pt in uld_pts[uid]:
-                    xx, yy, zz, dir_idx = ref_pt[0]
-                    dir_idx = ref_pt[3]
-
-                    for args in orient:
-                        xx = ref_pt[0] + (args[0] * directs[dir_idx][0])
-                        yy = ref_pt[1] + (args[1] * directs[dir_idx][1])
-                        zz = ref_pt[2] + (args[2] * directs[dir_idx][2])
-                        if xx < 0 or yy < 0 or zz < 0:
-                            continue
-
-                        if self.final_checker(
-                            uid, [xx, yy, zz], [args[0], args[1], args[2]], pid
-                        ):
-                            poss_pts.append(
-                                [
-                                    pid,
-                                    uid,
-                                    xx,
-                                    yy,
-                                    zz,
-                                    args[0],
-                                    args[1],
-                                    args[2],
-                                    dir_idx,
-                                ]
-                            )
-
-            poss_pts = sorted(
-                poss_pts,
-                key=lambda x: (
-                    -(self.all_ulds[x[1]].capacity - (self.uld_wts)[x[1]]),
-                    x[4],
-                    (
-                        abs(
-                            min(x[2], (self.all_ulds[x[1]].length - x[2] - x[5]))
-                            + min(x[3], (self.all_ulds[x[1]].width - x[3] - x[6]))
-                        )
-                    ),
-                    (x[2] * x[2] + x[3] * x[3] + x[4] * x[4]),
-                ),
-            )
+        Finds the best placement [pid, uid, x, y, z, a, b, c, dir_idx, ref_pt]
+        for the package with the configured engine, or None if the package
+        does not fit anywhere.
 
-            if len(poss_pts) == 0:
-                continue
-            else:
-                self.resultant_data.append(
-                    [
-                        poss_pts[0][0],
-                        poss_pts[0][1],
-                        poss_pts[0][2],
-                        poss_pts[0][3],
-                        poss_pts[0][4],
-                        poss_pts[0][2] + poss_pts[0][5],
-                        poss_pts[0][3] + poss_pts[0][6],
-                        poss_pts[0][4] + poss_pts[0][7],
-                    ]
-                )
+        The ULDs are ranked by the number of reference points they have, or
+        by their free weight capacity when `by_free_weight` is set
+        """
+        if self.engine == "numpy":
+            return self.find_candidate_numpy(pid, uld_pts, by_free_weight)
+        return self.find_candidate_python(pid, uld_pts, by_free_weight)
 
-                self.uld_wts[poss_pts[0][1]] += pckg.weight
-                x_t = poss_pts[0][2] - poss_pts[0][5] * directs[poss_pts[0][8]][0]
-                y_t = poss_pts[0][3] - poss_pts[0][6] * directs[poss_pts[0][8]][1]
-                z_t = poss_pts[0][4] - poss_pts[0][7] * directs[poss_pts[0][8]][2]
-
-                # Remove the used reference points
-                uld_pts[poss_pts[0][1]].remove([x_t, y_t, z_t, poss_pts[0][8]])
-
-                # Add 3 more reference points
-                self.add_point(
-                    poss_pts[0][1],
-                    x_t,
-                    y_t,
-                    z_t,
-                    poss_pts[0][5],
-                    poss_pts[0][6],
-                    poss_pts[0][7],
-                    uld_pts,
-                )
+    def commit_placement(self, best, uld_pts):
+        """
+        Places the package at the chosen candidate, and updates the
+        resultant data and the reference points for the next package
+        """
+        pid, uid = best[0], best[1]
+        p0 = [best[2], best[3], best[4]]
+        p1 = [best[2] + best[5], best[3] + best[6], best[4] + best[7]]
+        self.placements.place(pid, uid, p0, p1, self.problem.weights[pid])
+        self.index.insert(uid, p0, p1)
 
-    def place_leftover(self, uld_pts, order):
+        x_t = best[2] - best[5] * directs[best[8]][0]
+        y_t = best[3] - best[6] * directs[best[8]][1]
+        z_t = best[4] - best[7] * directs[best[8]][2]
+
+        # Remove the used reference point, and the ones the package covers
+        uld_pts.discard(uid, best[9])
+        uld_pts.prune_box(uid, p0, p1)
+
+        # Add the reference points of the new package
+        self.add_point(uid, x_t, y_t, z_t, best[5], best[6], best[7], uld_pts)
+
+    def snapshot(self, uld_pts):
         """
-        Places all the leftover packages in the ULDs
+        Returns a copy of the placement state, so that the
+        placement can be resumed from this point later
         """
-        for it in range(len(order)):
-            pid = order[it]
-            pckg = self.all_pkgs[pid]
-            poss_pts = []
-            a = pckg.length
-            b = pckg.width
-            c = pckg.height
-            orient = [[a, b, c], [a, c, b], [b, a, c], [b, c, a], [c, a, b], [c, b, a]]
-
-            for num in range(len(self.all_ulds)):
-                uid = self.all_ulds[num]
-                for ref_pt in uld_pts[uid]:
-                    xx, yy, zz, dir_idx = ref_pt[0]
-
-                    for args in orient:
-                        xx = ref_pt[0] + (args[0] * directs[dir_idx][0])
-                        yy = ref_pt[1] + (args[1] * directs[dir_idx][1])
-                        zz = ref_pt[2] + (args[2] * directs[dir_idx][2])
-                        if xx < 0 or yy < 0 or zz < 0:
-                            continue
-                        if self.final_checker(
-                            uid, [xx, yy, zz], [args[0], args[1], args[2]], pid
-                        ):
-                            poss_pts.append(
-                                [
-                                    pid,
-                                    uid,
-                                    xx,
-                                    yy,
-                                    zz,
-                                    args[0],
-                                    args[1],
-                                    args[2],
-                                    dir_idx,
-                                ]
-                            )
-
-            poss_pts = sorted(
-                poss_pts,
-                key=lambda x: (
-                    -(self.all_ulds[x[1]].capacity - (self.uld_wts)[x[1]]),
-                    x[4],
-                    (
-                        abs(
-                            min(x[2], (self.all_ulds[x[1]].length - x[2] - x[5]))
-                            + min(x[3], (self.all_ulds[x[1]].width - x[3] - x[6]))
-                        )
-                    ),
-                    (x[2] * x[2] + x[3] * x[3] + x[4] * x[4]),
-                ),
-            )
+        return (
+            self.placements.copy(),
+            uld_pts.copy(None),
+            self.pruned_pts,
+            self.dominated_pts,
+        )
 
-            if len(poss_pts) == 0:
-                continue
-            else:
-                # Update the resultant data and the reference points
-                self.resultant_data.append(
-                    [
-                        poss_pts[0][0],
-                        poss_pts[0][1],
-                        poss_pts[0][2],
-                        poss_pts[0][3],
-                        poss_pts[0][4],
-                        poss_pts[0][2] + poss_pts[0][5],
-                        poss_pts[0][3] + poss_pts[0][6],
-                        poss_pts[0][4] + poss_pts[0][7],
-                    ]
-                )
+    def restore(self, snapshot):
+        """
+        Restores the placement state from a snapshot,
+        and returns the reference points of the ULDs
+        """
+        store, uld_pts, pruned_pts, dominated_pts = snapshot
+        self.placements = store.copy()
+        self.pruned_pts = pruned_pts
+        self.dominated_pts = dominated_pts
+        self.rebuild_index()
+        return uld_pts.copy(self.index)
 
-                self.uld_wts[poss_pts[0][1]] += pckg.weight
-
-                x_t = poss_pts[0][2] - poss_pts[0][5] * directs[poss_pts[0][8]][0]
-                y_t = poss_pts[0][3] - poss_pts[0][6] * directs[poss_pts[0][8]][1]
-                z_t = poss_pts[0][4] - poss_pts[0][7] * directs[poss_pts[0][8]][2]
-
-                # Remove the used reference points
-                uld_pts[poss_pts[0][1]].remove([x_t, y_t, z_t, poss_pts[0][8]])
-
-                # Add 3 more reference points
-                self.add_point(
-                    poss_pts[0][1],
-                    x_t,
-                    y_t,
-                    z_t,
-                    poss_pts[0][5],
-                    poss_pts[0][6],
-                    poss_pts[0][7],
-                    uld_pts,
-                )
+    def rebuild_index(self):
+        """
+        Rebuilds the grid over the placed boxes from the store
+        """
+        self.index = SpatialIndex(self.problem.uld_cnt, self.problem.cell_size)
+        for _, uid, p0, p1 in self.placements.items():
+            self.index.insert(uid, p0, p1)
 
-    def check_new(self, pid, uid, x, y, z, x1, y1, z1, new_res):
+    def save_checkpoint(self, checkpoints, k, uld_pts):
         """
-        Checks if the new package can be placed in the ULD
+        Stores a snapshot if `k` packages of the phase are processed
+        and a checkpoint is due
         """
-        if x + x1 > (self.all_ulds[uid]).length:
-            return False
-        if y + y1 > (self.all_ulds[uid]).width:
-            return False
-        if z + z1 > (self.all_ulds[uid]).height:
-            return False
-        for ele in new_res:
-            if ele[1] == uid:
-                if check_intersection_cuboids(
-                    [x, y, z],
-                    [x + x1, y + y1, z + z1],
-                    [ele[2], ele[3], ele[4]],
-                    [ele[5], ele[6], ele[7]],
-                ):
-                    return False
+        if checkpoints is not None and k in checkpoints:
+            self.snapshots.put(checkpoints[k], self.snapshot(uld_pts))
 
-        return True
+    def place_priority(self, uld_pts, start=0, checkpoints=None):
+        """
+        Places all the priority packages in the ULDs
+        specified by the ULD points in the priority order,
+        skipping the first `start` already placed ones
+        """
+        for k in range(start, len(self.priority_order)):
+            pid = self.priority_order[k]
+            best = self.find_candidate(pid, uld_pts, by_free_weight=False)
+            if best is not None:
+                self.commit_placement(best, uld_pts)
+            self.save_checkpoint(checkpoints, k + 1, uld_pts)
+
+    def place_economy(self, uld_pts, start=0, checkpoints=None):
+        """
+        Places all the non-priority packages in the ULDs
+        specified by the ULD points in the non-priority order,
+        skipping the first `start` already placed ones
+        """
+        for k in range(start, len(self.non_priority_order)):
+            pid = self.non_priority_order[k]
+            best = self.find_candidate(pid, uld_pts, by_free_weight=True)
+            if best is not None:
+                self.commit_placement(best, uld_pts)
+            self.save_checkpoint(checkpoints, k + 1, uld_pts)
+
+    def place_leftover(self, uld_pts, order):
+        """
+        Places all the leftover packages in the ULDs
+        """
+        for pid in order:
+            best = self.find_candidate(pid, uld_pts, by_free_weight=True)
+            if best is not None:
+                self.commit_placement(best, uld_pts)
 
     def push_to_side_face_first(self, typ):
         """
         Pushes the packages to the side face of the ULD.
-        The `ty` parameter specifies the type of pushing to be done
+        The `typ` parameter specifies the type of pushing to be done:
+        1 - left face, 2 - right face, 3 - backmost face, 4 - frontmost face
         """
-        cpy_res = copy.copy(self.resultant_data)
-        new_res = []
+        order = np.array(self.placements.order, dtype=np.int64)
+        x, y, z = (self.placements.boxes[order, i] for i in range(3))
 
+        # Stable sorts, so that ties keep the current order of the packages
         if typ == 1:
-            # Push the packages to the left face of the ULD
-            cpy_res = sorted(cpy_res, key=lambda x: (x[2], x[3], x[4]))
-            for ele in cpy_res:
-                x_c = ele[2]
-                y_c = ele[3]
-                z_c = ele[4]
-                a = ele[5] - ele[2]
-                b = ele[6] - ele[3]
-                c = ele[7] - ele[4]
-                fct = False
-                while x_c > 0:
-                    x_c -= 1
-                    if not self.check_new(
-                        ele[0], ele[1], x_c, y_c, z_c, a, b, c, new_res
-                    ):
-                        new_res.append(
-                            [
-                                ele[0],
-                                ele[1],
-                                x_c + 1,
-                                y_c,
-                                z_c,
-                                x_c + a + 1,
-                                y_c + b,
-                                z_c + c,
-                            ]
-                        )
-                        fct = True
-                        break
-                if not fct:
-                    new_res.append(
-                        [ele[0], ele[1], x_c, y_c, z_c, x_c + a, y_c + b, z_c + c]
-                    )
-
+            axis, towards_zero = 0, True
+            order = order[np.lexsort((z, y, x))]
         elif typ == 2:
-            # Push the packages to the right face of the ULD
-            cpy_res = sorted(cpy_res, key=lambda x: (-x[2], x[3], x[4]))
-            for ele in cpy_res:
-                x_c = ele[2]
-                y_c = ele[3]
-                z_c = ele[4]
-                a = ele[5] - ele[2]
-                b = ele[6] - ele[3]
-                c = ele[7] - ele[4]
-                fct = False
-                lmt = self.all_ulds[ele[1]][1]
-
-                while x_c < lmt - 1:
-                    x_c += 1
-                    if not self.check_new(
-                        ele[0], ele[1], x_c, y_c, z_c, a, b, c, new_res
-                    ):
-                        new_res.append(
-                            [
-                                ele[0],
-                                ele[1],
-                                x_c - 1,
-                                y_c,
-                                z_c,
-                                x_c + a - 1,
-                                y_c + b,
-                                z_c + c,
-                            ]
-                        )
-                        fct = True
-                        break
+            axis, towards_zero = 0, False
+            order = order[np.lexsort((z, y, -x))]
+        elif typ == 3:
+            axis, towards_zero = 1, True
+            order = order[np.lexsort((z, x, y))]
+        else:
+            axis, towards_zero = 1, False
+            order = order[np.lexsort((z, x, -y))]
+        order = order.tolist()
 
-                if not fct:
-                    new_res.append(
-                        [ele[0], ele[1], x_c, y_c, z_c, x_c + a, y_c + b, z_c + c]
-                    )
+        sweep = AxisSweep(self.problem.uld_sizes, axis, towards_zero)
+        for pid, uid, p0, p1 in self.placements.items(order):
+            size = p1[axis] - p0[axis]
 
-        elif typ == 3:
-            # Push the packages to the backmost face of the ULD
-            cpy_res = sorted(cpy_res, key=lambda x: (x[3], x[2], x[4]))
-            for ele in cpy_res:
-                x_c = ele[2]
-                y_c = ele[3]
-                z_c = ele[4]
-                a = ele[5] - ele[2]
-                b = ele[6] - ele[3]
-                c = ele[7] - ele[4]
-                fct = False
-
-                while y_c > 0:
-                    y_c -= 1
-                    if not self.check_new(
-                        ele[0], ele[1], x_c, y_c, z_c, a, b, c, new_res
-                    ):
-                        new_res.append(
-                            [
-                                ele[0],
-                                ele[1],
-                                x_c,
-                                y_c + 1,
-                                z_c,
-                                x_c + a,
-                                y_c + b + 1,
-                                z_c + c,
-                            ]
-                        )
-                        fct = True
-                        break
+            p0[axis] = sweep.push(uid, p0, p1)
+            p1[axis] = p0[axis] + size
 
-                if not fct:
-                    new_res.append(
-                        [ele[0], ele[1], x_c, y_c, z_c, x_c + a, y_c + b, z_c + c]
-                    )
-        else:
-            # Push the packages to the frontmost face of the ULD
-            cpy_res = sorted(cpy_res, key=lambda x: (-x[3], x[2], x[4]))
-            for ele in cpy_res:
-                x_c = ele[2]
-                y_c = ele[3]
-                z_c = ele[4]
-                a = ele[5] - ele[2]
-                b = ele[6] - ele[3]
-                c = ele[7] - ele[4]
-                fct = False
-                lmt = self.all_ulds[ele[1]][2]
-
-                while y_c < lmt - 1:
-                    y_c += 1
-                    if not self.check_new(
-                        ele[0], ele[1], x_c, y_c, z_c, a, b, c, new_res
-                    ):
-                        new_res.append(
-                            [
-                                ele[0],
-                                ele[1],
-                                x_c,
-                                y_c - 1,
-                                z_c,
-                                x_c + a,
-                                y_c + b - 1,
-                                z_c + c,
-                            ]
-                        )
-                        fct = True
-                        break
-                if not fct:
-                    new_res.append(
-                        [ele[0], ele[1], x_c, y_c, z_c, x_c + a, y_c + b, z_c + c]
-                    )
+            sweep.insert(uid, p0, p1)
+            self.placements.move(pid, p0, p1)
 
-        self.resultant_data = new_res
+        self.placements.reorder(order)
+        self.rebuild_index()
 
     def place_packages(self):
         """
         Places all the packages in the ULDs with respect to the
-        priority and non-priority order
-        """
-        uld_pts = self.reset_uld_points()
-        self.place_priority(uld_pts)
-        self.push_to_side_face_first(4)
-        self.push_to_side_face_first(2)
+        priority and non-priority order. With a snapshot cache, the
+        placement resumes from the longest already placed prefix of
+        the order.
+        """
+        problem = self.problem
+        self.placements = PlacementStore(problem.pkg_cnt, problem.uld_cnt)
+        self.index = SpatialIndex(problem.uld_cnt, problem.cell_size)
+
+        prio_checkpoints = None
+        econ_checkpoints = None
+        econ_start, snapshot = 0, None
+        if self.snapshots is not None:
+            econ_checkpoints = self.snapshots.checkpoints(
+                b"economy", self.priority_order, self.non_priority_order, True
+            )
+            econ_start, snapshot = self.snapshots.longest(econ_checkpoints)
 
-        uld_pts = self.reset_uld_points()
-        self.place_economy(uld_pts)
-        self.push_to_side_face_first(4)
-        self.push_to_side_face_first(2)
+        if snapshot is not None:
+            self.snapshots.record(True, econ_start)
+            uld_pts = self.restore(snapshot)
+        else:
+            prio_start = 0
+            if self.snapshots is not None:
+                prio_checkpoints = self.snapshots.checkpoints(
+                    b"priority", [], self.priority_order
+                )
+                prio_start, snapshot = self.snapshots.longest(prio_checkpoints)
+                self.snapshots.record(snapshot is not None, prio_start)
+
+            if snapshot is not None:
+                uld_pts = self.restore(snapshot)
+            else:
+                uld_pts = self.reset_uld_points()
+            with self.profiler.timer("place_priority"):
+                self.place_priority(uld_pts, prio_start, prio_checkpoints)
+            self.pruned_pts += uld_pts.pruned
+            self.dominated_pts += uld_pts.dominated
+            with self.profiler.timer("push"):
+                self.push_to_side_face_first(4)
+                self.push_to_side_face_first(2)
+
+            uld_pts = self.reset_uld_points()
+            self.save_checkpoint(econ_checkpoints, 0, uld_pts)
+
+        with self.profiler.timer("place_economy"):
+            self.place_economy(uld_pts, econ_start, econ_checkpoints)
+        self.pruned_pts += uld_pts.pruned
+        self.dominated_pts += uld_pts.dominated
+        with self.profiler.timer("push"):
+            self.push_to_side_face_first(4)
+            self.push_to_side_face_first(2)
 
         uld_pts = self.reset_uld_points()
         not_packed = []
         for val in self.non_priority_order:
-            found = False
-            for item in self.resultant_data:
-                if -item[1] == val:
-                    found = True
-            if found == False:
+            if not self.placements.is_placed(val):
                 not_packed.append(val)
 
-        self.place_leftover(uld_pts, not_packed)
+        with self.profiler.timer("place_leftover"):
+            self.place_leftover(uld_pts, not_packed)
+        self.pruned_pts += uld_pts.pruned
+        self.dominated_pts += uld_pts.dominated
 
     def find_fitness(self):
         """
@@ -711,22 +539,15 @@ class Config:
             self.evaluated = True
             self.decode()
             self.place_packages()
-            self.prior_ct = 0
-            cntns_priority = []
-            for val in self.resultant_data:
-                if self.all_pkgs[val[0]].priority == 1:
-                    self.prior_ct += 1
-                    cntns_priority.append(val[1])
-
-            self.cnt_prior_uld = len(list(set(cntns_priority)))
-            self.score = 0
-            for val in self.resultant_data:
-                if self.all_pkgs[val[0]].priority == 0:
-                    self.score += self.all_pkgs[val[0]].cost
-            self.tot = 0
-
-            for obj in self.all_pkgs:
-                self.tot += obj.cost
+
+            placed = np.array(self.placements.order, dtype=np.int64)
+            priority = self.problem.priority_mask[placed]
+            self.prior_ct = int(np.count_nonzero(priority))
+            self.cnt_prior_uld = len(np.unique(self.placements.uld[placed[priority]]))
+
+            # The costs are added in the placement order, as before
+            self.score = sum(self.problem.costs[placed[~priority]].tolist())
+            self.tot = self.problem.total_cost
 
             score = (
                 self.tot
@@ -737,6 +558,16 @@ class Config:
             self.fitness_score = score
         return self.fitness_score
 
+    def set_result(self, fitness_score, placements):
+        """
+        Sets the result of an evaluation done elsewhere (eg. in a worker
+        process) for the same keys, without placing the packages again
+        """
+        self.decode()
+        self.placements = placements.copy()
+        self.fitness_score = fitness_score
+        self.evaluated = True
+
     def store(self, file_name):
         """
         Stores the output in a CSV file
@@ -744,31 +575,231 @@ class Config:
         """
         if self.evaluated == False:
             self.fitness_score = self.find_fitness()
-        pd.DataFrame(f"/data/${self.resultant_data}_{self.fitness_score}").to_csv(
-            file_name,
+        pd.DataFrame(self.resultant_data).to_csv(
+            f"{file_name}_{self.fitness_score}.csv",
             index=False,
             header=False,
         )
 
+
+# Problem shared by the worker processes of the genetic solver. It is set
+# once per worker, so that only the keys are sent for every evaluation
+_worker_problem = None
+
+
+def _init_worker(problem, engine, snapshot_size, snapshot_interval, prune_dominated):
+    global _worker_problem
+    snapshots = None
+    if snapshot_interval > 0:
+        snapshots = PrefixCache(snapshot_size, snapshot_interval)
+    _worker_problem = (problem, engine, snapshots, prune_dominated)
+
+
+def _evaluate_keys(keys):
+    """
+    Decodes the key vectors of a configuration and places its packages in
+    a worker process. Returns the fitness score, the placements and the
+    timings of the evaluation
+    """
+    problem, engine, snapshots, prune_dominated = _worker_problem
+    cnfg = Config(problem, engine, snapshots, Profiler(), prune_dominated)
+    cnfg.enc_priority_ord, cnfg.enc_non_priority_ord = keys
+    return cnfg.find_fitness(), cnfg.placements, cnfg.profiler.to_dict()
+
+
 class GeneticSolver:
     def __init__(
         self,
-        pkgs,
-        ulds,
-        pop_size=2,
+        problem,
+        pop_size=None,
         cnt_genes=500,
         elites=1,
         elite_crossover_prob=0.8,
+        engine="numpy",
+        workers=1,
+        mode="classic",
+        elite_frac=0.2,
+        mutant_frac=0.15,
+        max_stagnation=None,
+        time_limit=None,
+        cache_size=1024,
+        snapshot_size=256,
+        snapshot_interval=0,
+        prune_dominated=False,
+        callback=None,
+        profiler=None,
     ):
-        self.org_pkgs = pkgs
-        self.org_ulds = ulds
-        self.uld_cnt = len(ulds)
-        self.pkg_cnt = len(pkgs)
+        """
+        Solves the `problem`, a `ProblemContext`, see `GeneticSolver.of` to
+        solve packages and ULDs given as rows.
+
+        The `classic` mode keeps `elites` configurations and breeds a single
+        offspring every generation, filling the rest with random ones.
+
+        The `brkga` mode is a biased random-key GA: every generation keeps the
+        best `elite_frac` of the population, adds `mutant_frac` random
+        configurations, and fills the rest with crossovers of a random elite
+        and a random non-elite, which inherit each key from the elite with
+        probability `elite_crossover_prob`.
+
+        The search runs `cnt_genes` generations, or with `cnt_genes` None
+        until another stop is reached, and in both modes it stops early after
+        `max_stagnation` generations without improvement. With a `time_limit`
+        in seconds the
+        search is anytime: it stops before a generation which would end past
+        the limit, judging by the slowest generation so far, and the best
+        configuration found until then is returned. The initial population
+        is evaluated within the limit too, past it only the configurations
+        evaluated so far are kept. The limit bounds the search only, not
+        the post-processing of the returned placements.
+
+        Evaluations are memoized in an LRU cache of `cache_size` entries
+        keyed on the decoded order, see `cache.stats()` for the hit rate.
+        With a positive `snapshot_interval` the placement states are also
+        snapshotted every `snapshot_interval` packages, and configurations
+        resume from the longest prefix of their order that is already placed.
+        It is off by default, as most repeated orders are already answered
+        by the evaluation cache. With workers, every worker process keeps
+        its own snapshots.
+
+        With `prune_dominated` the reference points dominated by another
+        point of the same direction code are dropped, see `RefPointStore`.
+        The placers then scan far fewer points, but as a package which fits
+        at a dropped point may not fit at the point dominating it, the
+        placements are not always the same.
+
+        `callback` is called with the generation (0 for the initial population)
+        and the best fitness after every generation, and the search stops if
+        it returns True.
+
+        The time spent in every stage and the work done are collected in
+        `profiler`, including the evaluations done by the workers.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown genetic solver mode {mode}")
+        if pop_size is None:
+            pop_size = POP_SIZES[mode]
+
+        self.problem = problem
+        self.uld_cnt = problem.uld_cnt
+        self.pkg_cnt = problem.pkg_cnt
 
         self.pop_size = pop_size
         self.cnt_genes = cnt_genes
         self.elites = elites
         self.elite_crossover_prob = elite_crossover_prob
+        self.engine = engine
+        self.workers = workers
+        self.prune_dominated = prune_dominated
+
+        self.mode = mode
+        self.elite_cnt = max(1, int(round(elite_frac * pop_size)))
+        self.mutant_cnt = int(round(mutant_frac * pop_size))
+        if mode == "brkga" and self.elite_cnt + self.mutant_cnt >= pop_size:
+            raise ValueError("The population has no room for crossover offspring")
+        if cnt_genes is None and max_stagnation is None and time_limit is None:
+            raise ValueError("The search needs a number of generations or a stop")
+
+        self.max_stagnation = max_stagnation
+        self.time_limit = time_limit
+        self.callback = callback
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.generations = 0
+        self.best_fitness = None
+        self.cache = FitnessCache(cache_size)
+
+        self.snapshot_size = snapshot_size
+        self.snapshot_interval = snapshot_interval
+        self.snapshots = None
+        if snapshot_interval > 0:
+            self.snapshots = PrefixCache(snapshot_size, snapshot_interval)
+
+    @staticmethod
+    def of(pkgs, ulds, **params):
+        """
+        Returns a solver of the packages and the ULDs given as rows
+        """
+        return GeneticSolver(ProblemContext.of(pkgs, ulds), **params)
+
+    def evaluate(self, population, pool=None, deadline=None):
+        """
+        Finds the fitness of all the configurations of the population which
+        are not evaluated yet, spreading them over the worker pool if given.
+        Configurations which decode to an order that is already evaluated
+        reuse the cached result.
+        With a `deadline` (a `time.time()` value) the configurations are
+        evaluated a batch at a time, and the rest are left unevaluated once
+        the deadline has passed and at least one configuration is evaluated.
+        """
+        groups = {}
+        for cnfg in population:
+            if cnfg.evaluated:
+                continue
+
+            cnfg.decode()
+            key = FitnessCache.key(cnfg.priority_order, cnfg.non_priority_order)
+            if key in groups:
+                self.cache.hits += 1
+                self.profiler.count("cache_hits")
+                groups[key].append(cnfg)
+                continue
+
+            result = self.cache.get(key)
+            if result is not None:
+                self.profiler.count("cache_hits")
+                cnfg.set_result(*result)
+            else:
+                groups[key] = [cnfg]
+
+        pending = list(groups.items())
+        batch_size = len(pending)
+        if deadline is not None:
+            batch_size = 1 if pool is None else self.workers
+        incumbent = any(cnfg.evaluated for cnfg in population)
+
+        for begin in range(0, len(pending), max(1, batch_size)):
+            if incumbent and deadline is not None and time.time() >= deadline:
+                break
+            batch = pending[begin : begin + batch_size]
+            self.profiler.count("evaluations", len(batch))
+            if pool is None:
+                results = []
+                for _, cnfgs in batch:
+                    cnfgs[0].find_fitness()
+                    results.append((cnfgs[0].fitness_score, cnfgs[0].placements))
+            else:
+                keys = [
+                    (cnfgs[0].enc_priority_ord, cnfgs[0].enc_non_priority_ord)
+                    for _, cnfgs in batch
+                ]
+                chunksize = max(1, len(keys) // (4 * self.workers))
+                results = []
+                for fitness_score, placements, timings in pool.map(
+                    _evaluate_keys, keys, chunksize=chunksize
+                ):
+                    self.profiler.merge(timings)
+                    results.append((fitness_score, placements))
+
+            for (key, cnfgs), (fitness_score, placements) in zip(batch, results):
+                self.cache.put(key, fitness_score, placements)
+                for cnfg in cnfgs:
+                    if not cnfg.evaluated:
+                        cnfg.set_result(fitness_score, placements)
+            incumbent = True
+
+    def new_config(self):
+        """
+        Creates a configuration with random keys
+        """
+        cnfg = Config(
+            self.problem,
+            self.engine,
+            self.snapshots,
+            self.profiler,
+            self.prune_dominated,
+        )
+        cnfg.initialize()
+        return cnfg
 
     def crossover(self, elite, non_elite):
         """
@@ -776,61 +807,145 @@ class GeneticSolver:
         The elite has a higher probability of being selected, which is given by
         the `elite_crossover_prob` parameter
         """
-        offspring = Config(self.org_pkgs, self.org_ulds)
-        offspring.initialize()
+        offspring = Config(
+            self.problem,
+            self.engine,
+            self.snapshots,
+            self.profiler,
+            self.prune_dominated,
+        )
 
-        for i in range(self.uld_cnt):
-            if np.random.uniform(low=0.0, high=1.0) < self.elite_crossover_prob:
-                offspring.enc_priority_ord[i] = elite.enc_priority_ord[i]
-            else:
-                offspring.enc_priority_ord[i] = non_elite.enc_priority_ord[i]
+        mask = np.random.uniform(size=len(elite.enc_priority_ord))
+        offspring.enc_priority_ord = np.where(
+            mask < self.elite_crossover_prob,
+            elite.enc_priority_ord,
+            non_elite.enc_priority_ord,
+        )
 
-        for i in range(self.pkg_cnt):
-            if np.random.uniform(low=0.0, high=1.0) < self.elite_crossover_prob:
-                offspring.enc_non_priority_ord[i] = elite.enc_non_priority_ord[i]
-            else:
-                offspring.enc_non_priority_ord[i] = non_elite.enc_non_priority_ord[i]
+        mask = np.random.uniform(size=len(elite.enc_non_priority_ord))
+        offspring.enc_non_priority_ord = np.where(
+            mask < self.elite_crossover_prob,
+            elite.enc_non_priority_ord,
+            non_elite.enc_non_priority_ord,
+        )
         return offspring
 
-    def run(self):
+    def classic_generation(self, population):
         """
-        Runs the genetic algorithm to find the best configuration
+        Keeps the elites, and adds one offspring and random configurations
         """
-        population = []
-        for _ in range(self.pop_size):
-            cnfg = Config(
-                self.org_pkgs,
-                self.org_ulds,
-            )
-            cnfg.initialize()
-            population.append(cnfg)
+        new_pop = population[: self.elites]
+        elite_pop = population[: self.elites]
+        non_elite_pop = population[self.elites :]
 
-        population = sorted(population, key=lambda x: (x.find_fitness()))
+        rand_elite = random.choice(elite_pop)
+        rand_non_elite = random.choice(non_elite_pop)
 
-        for gen in range(self.cnt_genes):
-            new_pop = population[: self.elites]
-            elite_pop = population[: self.elites]
-            non_elite_pop = population[self.elites :]
+        offspring = self.crossover(rand_elite, rand_non_elite)
+        new_pop.append(offspring)
 
-            rand_elite = random.choice(elite_pop)
-            rand_non_elite = random.choice(non_elite_pop)
+        # Perform mutation
+        for _ in range(self.pop_size - 1 - self.elites):
+            new_pop.append(self.new_config())
 
-            offspring = self.crossover(rand_elite, rand_non_elite)
-            new_pop.append(offspring)
+        return new_pop
 
-            # Perform mutation
-            for _ in range(self.pop_size - 1 - self.elites):
-                rand_cnfg = Config(
-                    self.org_pkgs,
-                    self.org_ulds,
-                )
-                rand_cnfg.initialize()
-                new_pop.append(rand_cnfg)
+    def brkga_generation(self, population):
+        """
+        Keeps the elites, adds the mutants and fills the rest of
+        the population with elite biased crossovers
+        """
+        elite_pop = population[: self.elite_cnt]
+        non_elite_pop = population[self.elite_cnt :]
+
+        new_pop = list(elite_pop)
+        for _ in range(self.mutant_cnt):
+            new_pop.append(self.new_config())
+
+        cross_cnt = self.pop_size - len(new_pop)
+        elite_picks = np.random.randint(len(elite_pop), size=cross_cnt)
+        non_elite_picks = np.random.randint(len(non_elite_pop), size=cross_cnt)
+        for i, j in zip(elite_picks, non_elite_picks):
+            new_pop.append(self.crossover(elite_pop[i], non_elite_pop[j]))
 
-            population = new_pop
+        return new_pop
+
+    def run(self):
+        """
+        Runs the genetic algorithm to find the best configuration
+        """
+        start = time.time()
+        pool = None
+        if self.workers > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(
+                    self.problem,
+                    self.engine,
+                    self.snapshot_size,
+                    self.snapshot_interval,
+                    self.prune_dominated,
+                ),
+            )
+
+        if self.mode == "brkga":
+            next_generation = self.brkga_generation
+        else:
+            next_generation = self.classic_generation
+
+        try:
+            population = [self.new_config() for _ in range(self.pop_size)]
+            deadline = None
+            if self.time_limit is not None:
+                deadline = start + self.time_limit
+            with self.profiler.timer("evaluate"):
+                self.evaluate(population, pool, deadline)
+            # Past the deadline only the evaluated configurations are kept,
+            # the loop below stops before breeding from them
+            population = [cnfg for cnfg in population if cnfg.evaluated]
             population = sorted(population, key=lambda x: (x.find_fitness()))
-            if gen >= 5 and gen % 5 == 0:
-                population[0].store(gen)
 
+            best = population[0].fitness_score
+            stagnant = 0
+            slowest = 0
+            self.generations = 0
+
+            stopped = self.callback is not None and self.callback(0, best)
+
+            generations = itertools.count()
+            if self.cnt_genes is not None:
+                generations = range(self.cnt_genes)
+            for _ in generations:
+                if stopped:
+                    break
+                began = time.time()
+                if (
+                    self.time_limit is not None
+                    and began - start + slowest >= self.time_limit
+                ):
+                    break
+
+                population = next_generation(population)
+                with self.profiler.timer("evaluate"):
+                    self.evaluate(population, pool)
+                population = sorted(population, key=lambda x: (x.find_fitness()))
+                self.generations += 1
+                slowest = max(slowest, time.time() - began)
+
+                if population[0].fitness_score < best:
+                    best = population[0].fitness_score
+                    stagnant = 0
+                else:
+                    stagnant += 1
+
+                if self.callback is not None:
+                    stopped = self.callback(self.generations, best)
+                if self.max_stagnation is not None and stagnant >= self.max_stagnation:
+                    break
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        self.best_fitness = population[0].fitness_score
         return population[0].resultant_data
-    
\ No newline at end of file
@@ -1,5 +1,14 @@
-import copy
+import bisect
+import math
 import pandas as pd
+from collections import deque
+
+from core.compaction import AxisSweep
+from core.profiler import Profiler
+from core.store import PlacementStore
+
+# Passes which can be run on the solution before building the loading order
+POST_PROCESSES = ("push_in_z", "settle")
 
 
 class PackageManager:
@@ -7,34 +16,60 @@ class PackageManager:
     A class to manage package loading, collision checks, and dependency graph construction for ULDs
     """
 
-    def __init__(self, num_of_total_pkgs, num_of_ulds, uld_order, lis_u, sol):
+    def __init__(
+        self,
+        num_of_total_pkgs,
+        num_of_ulds,
+        uld_order,
+        lis_u,
+        sol,
+        post_process=None,
+        profiler=None,
+    ):
+        """
+        `lis_u` holds the [id, length, width, height] of every ULD, and `sol`
+        the [pid, uid, x1, y1, z1, x2, y2, z2] placement of every package.
+        `post_process` optionally names a pass from `POST_PROCESSES` which is
+        applied to the solution first. The time spent building the loading
+        order is collected in `profiler`.
+        """
+        if post_process is not None and post_process not in POST_PROCESSES:
+            raise ValueError(f"Unknown post processing pass {post_process}")
+
         self.num_of_total_pkgs = num_of_total_pkgs
         self.num_of_ulds = num_of_ulds
         self.uld_order = uld_order
         self.lis_u = lis_u
         self.sol = sol
+        self.profiler = profiler if profiler is not None else Profiler()
 
         # Initialize supporting structures
         self.adj_lis = [[] for _ in range(num_of_total_pkgs)]
-        self.available = [False] * num_of_total_pkgs
+        self.dependents = [[] for _ in range(num_of_total_pkgs)]
         self.find_pack = [[False, -1] for _ in range(num_of_total_pkgs)]
         self.uld_wise = [[] for _ in range(num_of_ulds)]
         self.package_wise_data = [[] for _ in range(num_of_total_pkgs)]
         self.in_deg = [0] * num_of_total_pkgs
-        self.visited = [False] * num_of_total_pkgs
         self.final_order = []
 
+        if post_process is not None:
+            with self.profiler.timer("post_process"):
+                self.sol = getattr(self, post_process)()
         self.group_packages_by_uld()
 
     def group_packages_by_uld(self):
         """
         Groups the packages by their assigned ULDs
         """
+        self.store = PlacementStore.from_rows(
+            self.sol, self.num_of_total_pkgs, self.num_of_ulds
+        )
 
-        for item in self.sol:
-            self.uld_wise[item[1]].append(item)
-            self.package_wise_data[item[0]] = item
-            self.find_pack[item[0]] = [True, item[1]]
+        for uid in range(self.num_of_ulds):
+            self.uld_wise[uid] = self.store.uld_rows(uid)
+            for item in self.uld_wise[uid]:
+                self.package_wise_data[item[0]] = item
+                self.find_pack[item[0]] = [True, uid]
 
     def check_new(self, uid, x, y, z, x1, y1, z1, new_res):
         """
@@ -74,9 +109,10 @@ class PackageManager:
 
     def push_in_z(self):
         """
-        Adjust the z-coordinate of packages to minimize space wastage.
+        Adjust the z-coordinate of packages to minimize space wastage,
+        by lowering every package one unit at a time.
         """
-        cpy_res = sorted(copy.deepcopy(self.sol), key=lambda x: (x[4], x[3], x[2]))
+        cpy_res = sorted(self.sol, key=lambda x: (x[4], x[3], x[2]))
         new_res = []
 
         for ele in cpy_res:
@@ -86,7 +122,7 @@ class PackageManager:
 
             while z_c > 0:
                 z_c -= 1
-                if not self.check_new(ele[0], ele[1], x_c, y_c, z_c, a, b, c, new_res):
+                if not self.check_new(ele[1], x_c, y_c, z_c, a, b, c, new_res):
                     new_res.append(
                         [
                             ele[0],
@@ -109,91 +145,160 @@ class PackageManager:
 
         return new_res
 
-    def find_dependencies(self, cord, dims, pid, uid, axis):
+    def settle(self):
         """
-        Find packages that are dependent on the current package, and initialize the dependency graph
-        for the topology sort.
+        Drops every package onto the packages settled below it, which gives
+        the same result as `push_in_z`. The resting height of a package is
+        found with one sweep over the settled packages, sorted by their top
+        faces, instead of lowering it one unit at a time.
         """
-        dependencies = []
-        idx = 0 if axis == "x" else 2
+        dims = [(uld[1], uld[2], uld[3]) for uld in self.lis_u]
+        sweep = AxisSweep(dims, 2, True)
+        new_res = []
+
+        for ele in sorted(self.sol, key=lambda x: (x[4], x[3], x[2])):
+            p0 = [ele[2], ele[3], ele[4]]
+            p1 = [ele[5], ele[6], ele[7]]
+            height = p1[2] - p0[2]
 
-        while cord[idx] > 0:
-            cord[idx] -= 1
-            for ele in self.uld_wise[uid]:
-                if ele[0] != pid and self.check_intersection_cuboids(
-                    cord,
-                    [cord[i] + dims[i] for i in range(3)],
-                    [ele[2], ele[3], ele[4]],
-                    [ele[5], ele[6], ele[7]],
-                ):
-                    dependencies.append(ele[0])
+            p0[2] = sweep.push(ele[1], p0, p1)
+            p1[2] = p0[2] + height
 
-        return list(dict.fromkeys(dependencies))
+            sweep.insert(ele[1], p0, p1)
+            new_res.append([ele[0], ele[1]] + p0 + p1)
+
+        return new_res
 
-    def construct_graph(self, pid, uid):
+    def build_projections(self, uid, idx):
         """
-        Construct a dependency graph for the packages.
+        Sorts the packages of the ULD by their near face on the axis `idx`,
+        so that the packages starting before a coordinate form a prefix
         """
-        self.available[pid] = True
-        data = next((i for i in self.uld_wise[uid] if i[0] == pid), None)
+        packages = sorted(self.uld_wise[uid], key=lambda ele: ele[2 + idx])
+        return [ele[2 + idx] for ele in packages], packages
 
-        if not data:
-            return
+    def find_dependencies(self, data, projections, idx):
+        """
+        Find the packages which must be loaded before the current package,
+        ie. the packages lying between it and the wall (x = 0) or the floor
+        (z = 0) of the ULD, that it would collide with while sliding there.
+
+        The swept region along the axis is found directly, and only the
+        packages starting before its end, a prefix of the projections found
+        by bisection, are checked. The prefix is still scanned, so a package
+        costs a check per package before it on the axis and a ULD costs
+        O(N^2) checks in the worst case, as many as the edges the graph can
+        have (eg. a row of packages along the axis, each blocked by all the
+        packages between it and the wall).
+        """
+        starts, packages = projections
+        pid = data[0]
+        s = data[2 + idx]
+        size = data[5 + idx] - s
+        if s <= 0:
+            return []
+
+        # The package slides one unit at a time until it reaches 0
+        low = s - math.ceil(s)
+        high = s - 1 + size
+        others = [i for i in range(3) if i != idx]
 
-        x, y, z = data[2:5]
-        a, b, c = data[5] - x, data[6] - y, data[7] - z
-        point = [x, y, z]
+        dependencies = []
+        for ele in packages[: bisect.bisect_left(starts, high)]:
+            if ele[0] == pid or ele[5 + idx] <= low:
+                continue
+            if all(
+                min(data[5 + i], ele[5 + i]) - max(data[2 + i], ele[2 + i]) > 0
+                for i in others
+            ):
+                dependencies.append(ele[0])
+
+        return dependencies
 
-        dependencies = self.find_dependencies(point[:], [a, b, c], pid, uid, "x")
-        dependencies += self.find_dependencies(point[:], [a, b, c], pid, uid, "z")
-        dependencies = list(set(dependencies))
+    def construct_graph(self):
+        """
+        Construct a dependency graph for the packages, where `adj_lis[pid]`
+        holds the packages blocking `pid`.
+        """
+        for uid in range(self.num_of_ulds):
+            along_x = self.build_projections(uid, 0)
+            along_z = self.build_projections(uid, 2)
 
-        self.adj_lis[pid] = dependencies
-        for dep in dependencies:
-            if not self.available[dep]:
-                self.construct_graph(dep, uid)
+            for data in self.uld_wise[uid]:
+                pid = data[0]
+                dependencies = self.find_dependencies(data, along_x, 0)
+                dependencies += self.find_dependencies(data, along_z, 2)
+                dependencies = sorted(set(dependencies))
+
+                self.adj_lis[pid] = dependencies
+                self.in_deg[pid] = len(dependencies)
+                for dep in dependencies:
+                    self.dependents[dep].append(pid)
 
     def topo_sort(self):
         """
-        Perform topological sort on the dependency graph.
+        Perform topological sort on the dependency graph, with Kahn's algorithm.
+        Packages left over by a cycle are loaded at the end in index order.
         """
+        with self.profiler.timer("graph_build"):
+            self.construct_graph()
 
-        def dfs(pid):
-            self.visited[pid] = True
-            for dep in self.adj_lis[pid]:
-                if not self.visited[dep]:
-                    dfs(dep)
-            self.final_order.append(pid)
-
-        pkg_ind = sorted(range(self.num_of_total_pkgs), key=lambda x: self.in_deg[x])
+        with self.profiler.timer("topo_sort"):
+            self.sort_graph()
 
-        for pid in pkg_ind:
-            if not self.visited[pid] and self.find_pack[pid][0]:
-                self.construct_graph(pid, self.find_pack[pid][1])
+    def sort_graph(self):
+        """
+        Orders the placed packages so that every package comes after the
+        packages blocking it
+        """
+        in_deg = list(self.in_deg)
+        placed = [
+            pid for pid in range(self.num_of_total_pkgs) if self.find_pack[pid][0]
+        ]
+        queue = deque(pid for pid in placed if in_deg[pid] == 0)
+        loaded = [False] * self.num_of_total_pkgs
+
+        while queue:
+            pid = queue.popleft()
+            loaded[pid] = True
+            self.final_order.append(pid)
+            for nxt in self.dependents[pid]:
+                in_deg[nxt] -= 1
+                if in_deg[nxt] == 0:
+                    queue.append(nxt)
 
-        for pid in pkg_ind:
-            if not self.visited[pid]:
-                dfs(pid)
+        for pid in placed:
+            if not loaded[pid]:
+                self.final_order.append(pid)
 
     def get_results(self):
         """
         Get the final sorted packages.
         """
-        self.topo_sort()
+        if not self.final_order:
+            self.topo_sort()
         return self.final_order
 
+    def get_blocking_sets(self):
+        """
+        Get the packages blocking every placed package, in the loading order.
+        """
+        order = self.get_results()
+        return {pid: self.adj_lis[pid] for pid in order}
+
     def export_results(self, filename="output.csv"):
         """
         Export the final sorted packages to a CSV file.
         """
-        final_data = [["uld_id", "pack_id", "x1", "y1", "z1", "x2", "y2", "z2"]]
+        final_data = []
 
-        for pid in self.final_order:
+        for pid in self.get_results():
             package = self.package_wise_data[pid]
-            package[0] += 1
-            package[1] += 1
             final_data.append(
-                ["U" + str(package[1]), "P-" + str(package[0])] + package[2:]
+                ["U" + str(package[1] + 1), "P-" + str(package[0] + 1)] + package[2:]
             )
 
-        return pd.DataFrame(final_data).to_dict(orient="records")
+        return pd.DataFrame(
+            final_data,
+            columns=["uld_id", "pack_id", "x1", "y1", "z1", "x2", "y2", "z2"],
+        ).to_dict(orient="records")
@@ -0,0 +1,152 @@
+import numpy as np
+
+# Offsets (in units of the package dimensions) from a reference point to
+# the origin of the package, indexed by the direction code of the point
+directs = [
+    [0, 0, 0],
+    [0, 0, 0],
+    [0, -1, 0],
+    [-1, 0, 0],
+    [-1, -1, 0],
+    [0, 0, -1],
+    [0, -1, -1],
+    [-1, 0, -1],
+    [-1, -1, -1],
+]
+DIRECTS = np.array(directs, dtype=float)
+
+# Upper bound on the number of (candidate, box) pairs compared at once
+# while checking for overlaps, to keep the temporary arrays small
+MAX_PAIRS = 1 << 20
+
+
+def orientations(a, b, c):
+    """
+    Returns the 6 axis aligned orientations of a package with
+    dimensions (a, b, c), in the order the placers try them
+    """
+    return [[a, b, c], [a, c, b], [b, a, c], [b, c, a], [c, a, b], [c, b, a]]
+
+
+def overlaps_any(p0, p1, boxes):
+    """
+    Checks the candidate cuboids (p0, p1), both of shape (C, 3), against the
+    placed boxes of shape (B, 6) and returns a boolean mask of shape (C,)
+    marking the candidates which intersect at least one box
+    """
+    hit = np.zeros(len(p0), dtype=bool)
+    if len(boxes) == 0 or len(p0) == 0:
+        return hit
+
+    b0 = boxes[None, :, :3]
+    b1 = boxes[None, :, 3:]
+    step = max(1, MAX_PAIRS // len(boxes))
+
+    for start in range(0, len(p0), step):
+        a0 = p0[start : start + step, None, :]
+        a1 = p1[start : start + step, None, :]
+        d = np.minimum(a1, b1) - np.maximum(a0, b0)
+        hit[start : start + step] = (d > 0).all(axis=2).any(axis=1)
+
+    return hit
+
+
+def best_candidate(
+    pid,
+    dims,
+    weight,
+    uld_pts,
+    uld_dims,
+    uld_wts,
+    capacity,
+    boxes,
+    primary,
+    profiler=None,
+    orient=None,
+):
+    """
+    Evaluates every (reference point, orientation) pair of every ULD for the
+    package `pid` in one batch and returns the best placement as
+    [pid, uid, x, y, z, a, b, c, dir_idx, ref_pt], or None if the package
+    cannot be placed anywhere.
+
+    The candidates are ranked with the same key as the scalar placers:
+    (primary[uid], z, distance from the nearest side walls, distance from
+    the origin), with ties broken by the order in which the candidates are
+    generated, so both engines pick the same placement.
+
+    The reference points scanned and the candidates checked for collisions
+    are counted in `profiler` if given. The orientations of the package can
+    be given as a (6, 3) array in `orient`, else they are built from `dims`.
+    """
+    if orient is None:
+        orient = np.array(orientations(*dims), dtype=float)
+    n_orient = len(orient)
+
+    pos_all, end_all, meta_all, key_all = [], [], [], []
+
+    for uid in range(len(uld_pts)):
+        pts = uld_pts[uid]
+        if len(pts) == 0 or uld_wts[uid] + weight > capacity[uid]:
+            continue
+
+        if profiler is not None:
+            profiler.count("ref_points_scanned", len(pts))
+        arr = np.asarray(pts, dtype=float).reshape(-1, 4)
+        dirs = DIRECTS[arr[:, 3].astype(int)]
+
+        pos = arr[:, None, :3] + orient[None, :, :] * dirs[:, None, :]
+        pos = pos.reshape(-1, 3)
+        ends = pos + np.tile(orient, (len(arr), 1))
+
+        ok = (pos >= 0).all(axis=1) & (ends <= uld_dims[uid]).all(axis=1)
+        idx = np.nonzero(ok)[0]
+        if len(idx) == 0:
+            continue
+
+        if profiler is not None:
+            profiler.count("collision_checks", len(idx))
+        idx = idx[~overlaps_any(pos[idx], ends[idx], boxes[uid])]
+        if len(idx) == 0:
+            continue
+
+        pos_all.append(pos[idx])
+        end_all.append(ends[idx])
+        meta_all.append(
+            np.stack([np.full(len(idx), uid), idx // n_orient, idx % n_orient], axis=1)
+        )
+        key_all.append(np.full(len(idx), primary[uid], dtype=float))
+
+    if len(pos_all) == 0:
+        return None
+
+    pos = np.concatenate(pos_all)
+    ends = np.concatenate(end_all)
+    meta = np.concatenate(meta_all)
+    first = np.concatenate(key_all)
+
+    x, y, z = pos[:, 0], pos[:, 1], pos[:, 2]
+    size = orient[meta[:, 2]]
+    length = uld_dims[meta[:, 0], 0]
+    width = uld_dims[meta[:, 0], 1]
+    wall = np.abs(
+        np.minimum(x, length - x - size[:, 0]) + np.minimum(y, width - y - size[:, 1])
+    )
+    dist = x * x + y * y + z * z
+
+    best = np.lexsort((dist, wall, z, first))[0]
+    uid, pt_idx, o_idx = (int(v) for v in meta[best])
+    ref_pt = uld_pts[uid][pt_idx]
+
+    return [
+        pid,
+        uid,
+        float(x[best]),
+        float(y[best]),
+        float(z[best]),
+        float(orient[o_idx][0]),
+        float(orient[o_idx][1]),
+        float(orient[o_idx][2]),
+        int(ref_pt[3]),
+        ref_pt,
+    ]
@@ -0,0 +1,220 @@
+from collections import defaultdict
+
+from core.placement import directs
+
+
+class RefPointStore:
+    """
+    Stores the reference points of every ULD as insertion ordered sets, so
+    that the points can be added and removed in O(1) and duplicates are
+    dropped. A point is (x, y, z, dir_idx), where the direction code tells
+    which octant around the point a package placed there extends into.
+
+    Points are pruned when they can never be used to place a package:
+    - The octant of the point lies outside of the ULD
+    - The octant of the point is occupied by a placed box
+
+    With `prune_dominated`, a point is also dropped when another point of
+    the same direction code dominates it: the point lies in the octant of
+    the other one, and the cuboid between the two is free, so the other
+    point is as close to the corner the octant grows from. A package which
+    fits at the dropped point may still collide at the other one, so this
+    can change the placements.
+
+    `pruned` counts the points dropped for either of the first two
+    reasons, `dominated` the points dropped for being dominated, and
+    `duplicates` the points which were already present in the store.
+    """
+
+    def __init__(self, uld_sizes, index, prune_dominated=False):
+        self.dims = list(uld_sizes)
+        self.index = index
+        self.cell_size = index.cell_size
+        self.prune_dominated = prune_dominated
+
+        self.pts = [{} for _ in range(len(self.dims))]
+        self.cells = [defaultdict(set) for _ in range(len(self.dims))]
+        self.by_dir = [defaultdict(set) for _ in range(len(self.dims))]
+        self._lists = [None] * len(self.dims)
+
+        self.pruned = 0
+        self.dominated = 0
+        self.duplicates = 0
+
+    def copy(self, index):
+        """
+        Returns a copy of the store, which checks the
+        occupied points against the given index
+        """
+        other = RefPointStore.__new__(RefPointStore)
+        other.dims = self.dims
+        other.index = index
+        other.cell_size = self.cell_size
+        other.prune_dominated = self.prune_dominated
+
+        other.pts = [dict(pts) for pts in self.pts]
+        other.cells = []
+        for cells in self.cells:
+            copied = defaultdict(set)
+            for cell, pts in cells.items():
+                copied[cell] = set(pts)
+            other.cells.append(copied)
+        other.by_dir = []
+        for by_dir in self.by_dir:
+            copied = defaultdict(set)
+            for dir_idx, pts in by_dir.items():
+                copied[dir_idx] = set(pts)
+            other.by_dir.append(copied)
+        other._lists = [None] * len(self.pts)
+
+        other.pruned = self.pruned
+        other.dominated = self.dominated
+        other.duplicates = self.duplicates
+        return other
+
+    def __getitem__(self, uid):
+        """
+        Returns the reference points of the ULD `uid` as a list
+        """
+        if self._lists[uid] is None:
+            self._lists[uid] = list(self.pts[uid])
+        return self._lists[uid]
+
+    def __len__(self):
+        return len(self.pts)
+
+    def total(self):
+        """
+        Returns the number of reference points across all the ULDs
+        """
+        return sum(len(pts) for pts in self.pts)
+
+    def _cell(self, pt):
+        cs = self.cell_size
+        return (int(pt[0] // cs), int(pt[1] // cs), int(pt[2] // cs))
+
+    def is_blocked(self, pt, b0, b1):
+        """
+        Checks if the octant of the point `pt` starts inside the box (b0, b1)
+        """
+        direct = directs[pt[3]]
+        for i in range(3):
+            if direct[i] == 0:
+                if not (b0[i] <= pt[i] < b1[i]):
+                    return False
+            elif not (b0[i] < pt[i] <= b1[i]):
+                return False
+        return True
+
+    def is_useful(self, uid, pt):
+        """
+        Checks if a package can ever be placed at the point `pt`
+        """
+        direct = directs[pt[3]]
+        for i in range(3):
+            if direct[i] == 0 and pt[i] >= self.dims[uid][i]:
+                return False
+            if direct[i] != 0 and pt[i] <= 0:
+                return False
+
+        for b0, b1 in self.index.near(uid, pt):
+            if self.is_blocked(pt, b0, b1):
+                return False
+        return True
+
+    def covers(self, uid, pt, other):
+        """
+        Checks if the point `pt` dominates the point `other` of the same
+        direction code: `other` lies in the octant of `pt`, and the cuboid
+        between them is free, so a package placed at `other` could slide
+        towards `pt` through empty space
+        """
+        direct = directs[pt[3]]
+        for i in range(3):
+            if direct[i] == 0 and pt[i] > other[i]:
+                return False
+            if direct[i] != 0 and pt[i] < other[i]:
+                return False
+
+        p0 = [min(pt[i], other[i]) for i in range(3)]
+        p1 = [max(pt[i], other[i]) for i in range(3)]
+        for b0, b1 in self.index.around(uid, p0, p1):
+            blocked = True
+            for i in range(3):
+                if p0[i] < p1[i]:
+                    blocked = b0[i] < p1[i] and b1[i] > p0[i]
+                elif direct[i] == 0:
+                    blocked = b0[i] <= p0[i] < b1[i]
+                else:
+                    blocked = b0[i] < p0[i] <= b1[i]
+                if not blocked:
+                    break
+            if blocked:
+                return False
+        return True
+
+    def add(self, uid, pt):
+        """
+        Adds the point `pt` to the ULD `uid`, unless it is already
+        present or it can not be used to place a package. With
+        `prune_dominated`, a point dominated by another point of the
+        same direction code is dropped, and the new point drops the
+        points it dominates.
+        """
+        pt = tuple(pt)
+        if pt in self.pts[uid]:
+            self.duplicates += 1
+            return
+        if not self.is_useful(uid, pt):
+            self.pruned += 1
+            return
+
+        if self.prune_dominated:
+            same = self.by_dir[uid][pt[3]]
+            if any(self.covers(uid, other, pt) for other in same):
+                self.dominated += 1
+                return
+            covered = [other for other in same if self.covers(uid, pt, other)]
+            for other in covered:
+                self.discard(uid, other)
+            self.dominated += len(covered)
+
+        self.pts[uid][pt] = None
+        self.cells[uid][self._cell(pt)].add(pt)
+        self.by_dir[uid][pt[3]].add(pt)
+        self._lists[uid] = None
+
+    def discard(self, uid, pt):
+        """
+        Removes the point `pt` from the ULD `uid` if it is present
+        """
+        pt = tuple(pt)
+        if pt not in self.pts[uid]:
+            return
+
+        del self.pts[uid][pt]
+        self.cells[uid][self._cell(pt)].discard(pt)
+        self.by_dir[uid][pt[3]].discard(pt)
+        self._lists[uid] = None
+
+    def prune_box(self, uid, b0, b1):
+        """
+        Removes the points of the ULD `uid` which are occupied by the
+        newly placed box (b0, b1)
+        """
+        cs = self.cell_size
+        lo = [int(v // cs) for v in b0]
+        hi = [int(v // cs) for v in b1]
+        cells = self.cells[uid]
+
+        blocked = []
+        for i in range(lo[0], hi[0] + 1):
+            for j in range(lo[1], hi[1] + 1):
+                for k in range(lo[2], hi[2] + 1):
+                    for pt in cells.get((i, j, k), ()):
+                        if self.is_blocked(pt, b0, b1):
+                            blocked.append(pt)
+
+        for pt in blocked:
+            self.discard(uid, pt)
+        self.pruned += len(blocked)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from core.placement import orientations
+from core.spatial import suggest_cell_size
+
+
+def frozen(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+# Fields of the packages and the ULDs a problem is built from
+PACKAGE_FIELDS = ("length", "width", "height", "weight", "cost", "priority")
+ULD_FIELDS = ("length", "width", "height", "weight")
+
+
+class ProblemContext:
+    """
+    The tables of a problem which every configuration reads but never
+    changes, built once per solver and shared by all its configurations
+    (and sent once to every worker process):
+    - the indices of the priority and the economy packages, and their counts
+    - the priority mask, the costs and the total cost of the packages
+    - the dimensions, weights and orientations of the packages
+    - the dimensions and weight capacities of the ULDs
+
+    The packages and the ULDs are given as dictionaries from the field
+    names to one sequence of values per field, see `ProblemContext.of`
+    for rows. The arrays are read-only, so a configuration cannot change
+    them by mistake for the others.
+    """
+
+    def __init__(self, packages, ulds):
+        self.pkg_cnt = len(packages["length"])
+        self.uld_cnt = len(ulds["length"])
+
+        self.priority_mask = frozen(np.array(packages["priority"], dtype=bool))
+        self.priority_idx = frozen(np.flatnonzero(self.priority_mask))
+        self.non_priority_idx = frozen(np.flatnonzero(~self.priority_mask))
+        self.count_priority_pkg = len(self.priority_idx)
+        self.count_non_priority_pkg = len(self.non_priority_idx)
+
+        self.costs = frozen(np.array(packages["cost"], dtype=float))
+        self.total_cost = sum(self.costs.tolist())
+
+        self.dims = tuple(
+            zip(packages["length"], packages["width"], packages["height"])
+        )
+        self.weights = tuple(packages["weight"])
+        self.orientations = tuple(orientations(*dims) for dims in self.dims)
+        self.orient_arrays = tuple(
+            frozen(np.array(orient, dtype=float)) for orient in self.orientations
+        )
+
+        self.uld_sizes = tuple(zip(ulds["length"], ulds["width"], ulds["height"]))
+        self.uld_dims = frozen(np.array(self.uld_sizes, dtype=float).reshape(-1, 3))
+        self.capacity = tuple(ulds["weight"])
+
+        self.cell_size = suggest_cell_size(self.dims)
+
+    @staticmethod
+    def of(pkgs, ulds):
+        """
+        Returns the context of the packages and the ULDs given as rows
+        """
+        return ProblemContext(
+            {field: [getattr(pkg, field) for pkg in pkgs] for field in PACKAGE_FIELDS},
+            {field: [getattr(uld, field) for uld in ulds] for field in ULD_FIELDS},
+        )
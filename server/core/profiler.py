@@ -0,0 +1,76 @@
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Collects the time spent in the stages of a solve, and counters of the
+    work done (eg. collision checks). Profilers of separate solves or of
+    worker processes are combined with `merge`, which is safe to call from
+    several threads.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Adds the time spent in the block to the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+            self.calls[stage] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "stages": {
+                    stage: {"seconds": self.seconds[stage], "calls": self.calls[stage]}
+                    for stage in self.seconds
+                },
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, data):
+        """
+        Adds the timings of another profiler, given by its `to_dict`
+        """
+        with self.lock:
+            for stage, timing in data["stages"].items():
+                self.seconds[stage] += timing["seconds"]
+                self.calls[stage] += timing["calls"]
+            for name, n in data["counters"].items():
+                self.counters[name] += n
+
+    def prometheus(self, prefix="solver"):
+        """
+        Returns the timings in the Prometheus text exposition format
+        """
+        with self.lock:
+            lines = [f"# TYPE {prefix}_stage_seconds_total counter"]
+            for stage, seconds in sorted(self.seconds.items()):
+                lines.append(
+                    f'{prefix}_stage_seconds_total{{stage="{stage}"}} {seconds}'
+                )
+
+            lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+            for stage, calls in sorted(self.calls.items()):
+                lines.append(f'{prefix}_stage_calls_total{{stage="{stage}"}} {calls}')
+
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for name, n in sorted(self.counters.items()):
+                lines.append(f'{prefix}_events_total{{event="{name}"}} {n}')
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,133 @@
+import numpy as np
+from collections import defaultdict
+
+
+def check_intersection_cuboids(a0, a1, b0, b1):
+    dx = min(a1[0], b1[0]) - max(a0[0], b0[0])
+    dy = min(a1[1], b1[1]) - max(a0[1], b0[1])
+    dz = min(a1[2], b1[2]) - max(a0[2], b0[2])
+    if dx <= 0 or dy <= 0 or dz <= 0:
+        return False
+    return True
+
+
+def suggest_cell_size(dims):
+    """
+    Suggests a grid cell size for packages with the given (length, width,
+    height) dimensions, which is the mean package dimension. With cells of
+    this size a query for a package sized cuboid only touches a handful of
+    cells.
+    """
+    if len(dims) == 0:
+        return 1
+
+    tot = 0
+    for length, width, height in dims:
+        tot += length + width + height
+    return max(1, tot / (3 * len(dims)))
+
+
+class SpatialIndex:
+    """
+    A uniform grid over every ULD, which stores the placed boxes so that
+    collision checks only look at the boxes sharing a cell with the query
+    cuboid instead of all the placed boxes.
+    """
+
+    def __init__(self, uld_cnt, cell_size):
+        self.cell_size = cell_size
+        self.cells = [defaultdict(list) for _ in range(uld_cnt)]
+        self.boxes = []
+        self.uld_boxes = [[] for _ in range(uld_cnt)]
+        self._arrays = [None] * uld_cnt
+
+    def _cells(self, p0, p1):
+        """
+        Yields all the grid cells covered by the cuboid (p0, p1)
+        """
+        cs = self.cell_size
+        x0, y0, z0 = int(p0[0] // cs), int(p0[1] // cs), int(p0[2] // cs)
+        x1, y1, z1 = int(p1[0] // cs), int(p1[1] // cs), int(p1[2] // cs)
+
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                for k in range(z0, z1 + 1):
+                    yield (i, j, k)
+
+    def insert(self, uid, p0, p1):
+        """
+        Adds the box (p0, p1) to the grid of the ULD `uid`
+        """
+        box_idx = len(self.boxes)
+        self.boxes.append((tuple(p0), tuple(p1)))
+
+        cells = self.cells[uid]
+        for cell in self._cells(p0, p1):
+            cells[cell].append(box_idx)
+
+        self.uld_boxes[uid].append(box_idx)
+        self._arrays[uid] = None
+
+    def intersects(self, uid, p0, p1):
+        """
+        Checks if the cuboid (p0, p1) intersects any box placed in the ULD `uid`
+        """
+        cells = self.cells[uid]
+        seen = set()
+
+        for cell in self._cells(p0, p1):
+            for box_idx in cells.get(cell, ()):
+                if box_idx in seen:
+                    continue
+                seen.add(box_idx)
+
+                b0, b1 = self.boxes[box_idx]
+                if check_intersection_cuboids(p0, p1, b0, b1):
+                    return True
+
+        return False
+
+    def around(self, uid, p0, p1):
+        """
+        Yields the boxes of the ULD `uid` registered in the grid cells
+        covered by the cuboid (p0, p1), every box once
+        """
+        cells = self.cells[uid]
+        seen = set()
+        for cell in self._cells(p0, p1):
+            for box_idx in cells.get(cell, ()):
+                if box_idx not in seen:
+                    seen.add(box_idx)
+                    yield self.boxes[box_idx]
+
+    def near(self, uid, pt):
+        """
+        Yields the boxes of the ULD `uid` registered in the grid cell of the
+        point `pt`, which include all the boxes containing the point
+        """
+        cs = self.cell_size
+        cell = (int(pt[0] // cs), int(pt[1] // cs), int(pt[2] // cs))
+        for box_idx in self.cells[uid].get(cell, ()):
+            yield self.boxes[box_idx]
+
+    def box_array(self, uid):
+        """
+        Returns the boxes placed in the ULD `uid` as an array of shape (B, 6),
+        with the rows being (x1, y1, z1, x2, y2, z2)
+        """
+        if self._arrays[uid] is None:
+            rows = [
+                self.boxes[idx][0] + self.boxes[idx][1] for idx in self.uld_boxes[uid]
+            ]
+            self._arrays[uid] = np.array(rows, dtype=float).reshape(-1, 6)
+        return self._arrays[uid]
+
+    def clear(self):
+        """
+        Removes all the boxes from the index
+        """
+        for cells in self.cells:
+            cells.clear()
+        self.boxes = []
+        self.uld_boxes = [[] for _ in self.cells]
+        self._arrays = [None] * len(self.cells)
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class PlacementStore:
+    """
+    The placements of a configuration, kept in arrays preallocated for all
+    the packages and indexed by the package id:
+    - `uld[pid]` is the ULD holding the package, or -1 if it is not placed
+    - `boxes[pid]` is the (x1, y1, z1, x2, y2, z2) of the package
+
+    `order` lists the placed packages in the order of the `resultant_data`
+    rows, `members[uid]` the packages of every ULD in the same order, and
+    `weights[uid]` the total weight placed in every ULD (a list, as the
+    placers read it for every candidate).
+    """
+
+    def __init__(self, pkg_cnt, uld_cnt):
+        self.uld = np.full(pkg_cnt, -1, dtype=np.int64)
+        self.boxes = np.zeros((pkg_cnt, 6))
+        self.weights = [0] * uld_cnt
+        self.order = []
+        self.members = [[] for _ in range(uld_cnt)]
+
+    def __len__(self):
+        return len(self.order)
+
+    def is_placed(self, pid):
+        return self.uld[pid] >= 0
+
+    def place(self, pid, uid, p0, p1, weight):
+        """
+        Places the package `pid` in the ULD `uid` at the box (p0, p1)
+        """
+        self.uld[pid] = uid
+        self.boxes[pid, :3] = p0
+        self.boxes[pid, 3:] = p1
+        self.weights[uid] += weight
+        self.order.append(pid)
+        self.members[uid].append(pid)
+
+    def move(self, pid, p0, p1):
+        """
+        Moves the placed package `pid` to the box (p0, p1)
+        """
+        self.boxes[pid, :3] = p0
+        self.boxes[pid, 3:] = p1
+
+    def reorder(self, order):
+        """
+        Sets the order of the placed packages, which must
+        be a permutation of the current order
+        """
+        self.order = list(order)
+        self.members = [[] for _ in self.members]
+        for pid in self.order:
+            self.members[self.uld[pid]].append(pid)
+
+    def items(self, pids=None):
+        """
+        Yields (pid, uid, p0, p1) for the given packages, by default
+        all the placed packages in order
+        """
+        if pids is None:
+            pids = self.order
+        uids = self.uld[pids].tolist()
+        boxes = self.boxes[pids].tolist()
+        for pid, uid, box in zip(pids, uids, boxes):
+            yield pid, uid, box[:3], box[3:]
+
+    def rows(self, pids=None):
+        """
+        Returns the placements as rows of the `resultant_data` format,
+        ie. [pid, uid, x1, y1, z1, x2, y2, z2]
+        """
+        return [[pid, uid] + p0 + p1 for pid, uid, p0, p1 in self.items(pids)]
+
+    def uld_rows(self, uid):
+        """
+        Returns the rows of the packages in the ULD `uid`
+        """
+        return self.rows(self.members[uid])
+
+    def copy(self):
+        other = PlacementStore.__new__(PlacementStore)
+        other.uld = self.uld.copy()
+        other.boxes = self.boxes.copy()
+        other.weights = list(self.weights)
+        other.order = list(self.order)
+        other.members = [list(pids) for pids in self.members]
+        return other
+
+    @staticmethod
+    def from_rows(rows, pkg_cnt, uld_cnt, weights=None):
+        """
+        Builds the store from rows in the `resultant_data` format, with the
+        weights of the packages given by `weights[pid]` if needed
+        """
+        store = PlacementStore(pkg_cnt, uld_cnt)
+        for row in rows:
+            weight = 0 if weights is None else weights[row[0]]
+            store.place(row[0], row[1], row[2:5], row[5:8], weight)
+        return store
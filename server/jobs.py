@@ -0,0 +1,253 @@
+import asyncio
+import json
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from core.profiler import Profiler
+from solution import generate_solution, solution_key, Request
+
+# States of a job, the last three are final
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def _run_job(req, events, cancel):
+    """
+    Runs in a pool process, solving the request while pushing the best
+    fitness of every generation onto the `events` queue
+    """
+    if cancel.is_set():
+        return None
+    events.put({"event": RUNNING})
+
+    def callback(generation, fitness):
+        events.put(
+            {"event": "progress", "generation": generation, "fitness": float(fitness)}
+        )
+        return cancel.is_set()
+
+    return generate_solution(req, callback=callback)
+
+
+class Job:
+    def __init__(self, job_id, events, cancel):
+        self.id = job_id
+        self.events = events
+        self.cancel = cancel
+        self.future = None
+
+        self.state = QUEUED
+        self.progress = []
+        self.result = None
+        self.stats = None
+        self.error = None
+        self.finished_at = None
+        # Whether the solution came from the cache, None if it is not cached
+        self.cache_hit = None
+
+    def is_final(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def status(self):
+        """
+        Returns the state of the job with its latest progress
+        """
+        status = {"job_id": self.id, "state": self.state}
+        if self.progress:
+            status["generation"] = self.progress[-1]["generation"]
+            status["fitness"] = self.progress[-1]["fitness"]
+        if self.stats is not None:
+            status.update(self.stats)
+        if self.error is not None:
+            status["error"] = self.error
+        if self.cache_hit is not None:
+            status["cache"] = "HIT" if self.cache_hit else "MISS"
+        return status
+
+
+class JobManager:
+    """
+    Runs the solves in a pool of processes, so that long runs do not block
+    the server. The progress reported by a job is collected by a watcher
+    task on the event loop, which any number of clients can then follow.
+    The timings of the finished jobs are added up in `profile`.
+
+    Finished jobs are kept for `ttl` seconds, and at most `max_finished` of
+    them are kept (the oldest are dropped first), after which they are
+    unknown to `get`.
+
+    With a `cache`, the jobs share the solutions of `/api`: a request whose
+    solution is cached finishes right away, and the solutions of the jobs
+    are added to it. The cache is only used from this process.
+    """
+
+    def __init__(self, max_workers=None, ttl=3600, max_finished=1000, cache=None):
+        self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.cache = cache
+        self.sync = multiprocessing.Manager()
+        self.jobs = {}
+        self.finished = OrderedDict()
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.watchers = set()
+        self.profile = Profiler()
+
+    def submit(self, req: Request):
+        """
+        Queues the request and returns its job, which is already done if
+        the solution of the request is cached
+        """
+        key = None
+        if self.cache is not None:
+            key = solution_key(req)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                job = Job(uuid.uuid4().hex, None, None)
+                job.result, job.stats = cached["solution"], cached["stats"]
+                job.cache_hit = True
+                job.state = DONE
+                with self.lock:
+                    self.jobs[job.id] = job
+                self.finish(job)
+                return job
+
+        job = Job(uuid.uuid4().hex, self.sync.Queue(), self.sync.Event())
+        job.future = self.pool.submit(_run_job, req, job.events, job.cancel)
+        with self.lock:
+            self.evict()
+            self.jobs[job.id] = job
+        task = asyncio.get_running_loop().create_task(self.watch(job, key))
+        self.watchers.add(task)
+        task.add_done_callback(self.watchers.discard)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            self.evict()
+            return self.jobs.get(job_id)
+
+    def evict(self):
+        """
+        Drops the finished jobs past their time to live, and the oldest
+        ones over `max_finished`. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        while self.finished:
+            job_id, finished_at = next(iter(self.finished.items()))
+            if now - finished_at < self.ttl and len(self.finished) <= self.max_finished:
+                break
+            del self.finished[job_id]
+            del self.jobs[job_id]
+
+    def finish(self, job):
+        """
+        Marks the job as finished, releasing its queue and event
+        in the manager process as they are no longer used
+        """
+        job.events = None
+        job.cancel = None
+        job.future = None
+        with self.lock:
+            job.finished_at = time.monotonic()
+            self.finished[job.id] = job.finished_at
+            self.evict()
+
+    def drain(self, job, timeout):
+        """
+        Moves the events reported by the job so far into its progress,
+        waiting up to `timeout` seconds for the first one
+        """
+        try:
+            event = job.events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            if event["event"] == RUNNING:
+                if job.state == QUEUED:
+                    job.state = RUNNING
+            else:
+                job.progress.append(
+                    {"generation": event["generation"], "fitness": event["fitness"]}
+                )
+            try:
+                event = job.events.get_nowait()
+            except queue.Empty:
+                return
+
+    async def watch(self, job, key=None):
+        """
+        Follows the job until it finishes, then records its outcome, and
+        caches its solution under `key` if given
+        """
+        loop = asyncio.get_running_loop()
+        while not job.future.done():
+            await loop.run_in_executor(None, self.drain, job, 0.5)
+        await loop.run_in_executor(None, self.drain, job, 0)
+
+        if job.future.cancelled() or job.cancel.is_set():
+            job.state = CANCELLED
+        elif job.future.exception() is not None:
+            job.state = FAILED
+            job.error = str(job.future.exception())
+        else:
+            job.result, job.stats = job.future.result()
+            self.profile.merge(job.stats["timings"])
+            job.state = DONE
+            if key is not None:
+                self.cache.put(key, {"solution": job.result, "stats": job.stats})
+                job.cache_hit = False
+
+        self.finish(job)
+
+    def cancel(self, job):
+        """
+        Cancels the job. A queued job never starts, while a running one
+        stops after its current generation, but either way the job is
+        reported as cancelled from now on.
+        """
+        if job.is_final() or job.cancel is None:
+            return
+        job.cancel.set()
+        job.future.cancel()
+        job.state = CANCELLED
+
+    async def stream(self, job, interval=0.5):
+        """
+        Yields the progress of the job as Server-Sent Events, ending
+        with the final state of the job
+        """
+        sent = 0
+        while True:
+            final = job.is_final()
+            while sent < len(job.progress):
+                yield f"event: progress\ndata: {json.dumps(job.progress[sent])}\n\n"
+                sent += 1
+            if final:
+                break
+            await asyncio.sleep(interval)
+
+        yield f"event: {job.state}\ndata: {json.dumps(job.status())}\n\n"
+
+    async def shutdown(self):
+        """
+        Cancels all the jobs and waits for the running ones to stop
+        """
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            self.cancel(job)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.pool.shutdown)
+        await asyncio.gather(*self.watchers)
+        self.sync.shutdown()
@@ -1,17 +1,46 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-from solution import generate_solution, Request as SolutionRequest
+from jobs import JobManager, DONE
+from core.cache import SolutionCache
+from core.profiler import Profiler
+from solution import (
+    solve_cached,
+    ColumnarRequest as ColumnarSolutionRequest,
+    Request as SolutionRequest,
+)
 from metrics_handler import (
-    moi_metric,
+    ColumnarPlanRequest,
+    ColumnarRequest as ColumnarMetricsRequest,
     Request as MetricsRequest,
-    used_space,
-    used_weight,
-    stability,
-    pack_volume,
+    PlanRequest,
+    plan_metrics,
+    request_metrics,
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.profile = Profiler()
+    app.state.solutions = SolutionCache(
+        maxsize=int(os.environ.get("SOLUTION_CACHE_SIZE", 128)),
+        path=os.environ.get("SOLUTION_CACHE_DB"),
+    )
+    app.state.jobs = JobManager(
+        ttl=float(os.environ.get("JOB_TTL", 3600)),
+        max_finished=int(os.environ.get("JOB_MAX_FINISHED", 1000)),
+        cache=app.state.solutions,
+    )
+    yield
+    await app.state.jobs.shutdown()
+    app.state.solutions.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -26,17 +55,94 @@ def health_check():
 
 
 @app.post("/api")
-def get_solution(request: SolutionRequest):
-    return generate_solution(request)
+def get_solution(
+    request: SolutionRequest | ColumnarSolutionRequest,
+    response: Response,
+    verbose: bool = False,
+):
+    """
+    Returns the placements, or with `verbose` an object holding the
+    placements and the stats of the solve
+    """
+    solution, stats, hit = solve_cached(request, app.state.solutions)
+    if hit is False:
+        app.state.profile.merge(stats["timings"])
+
+    response.headers["X-Generations"] = str(stats["generations"])
+    response.headers["X-Evaluations"] = str(stats["evaluations"])
+    if hit is None:
+        response.headers["X-Cache"] = "BYPASS"
+    else:
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+
+    if verbose:
+        return {"solution": solution, **stats}
+    return solution
 
 
 @app.post("/api/metrics")
-def get_metrics(request: MetricsRequest):
-    return {
-        "moi": moi_metric(request),
-        "count": len(request.packages),
-        "utilization": used_space(request),
-        "weight_utilization": used_weight(request),
-        "stability": stability(request),
-        "pack_volume": pack_volume(request),
-    }
+def get_metrics(request: MetricsRequest | ColumnarMetricsRequest):
+    return request_metrics(request)
+
+
+@app.post("/api/metrics/batch")
+def get_plan_metrics(request: PlanRequest | ColumnarPlanRequest):
+    return plan_metrics(request)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_profile():
+    """
+    Exposes the timings of all the solves in the Prometheus text format
+    """
+    profile = Profiler()
+    profile.merge(app.state.profile.to_dict())
+    profile.merge(app.state.jobs.profile.to_dict())
+
+    cache = app.state.solutions.stats()
+    lines = [profile.prometheus().rstrip()]
+    for name in ("hits", "misses"):
+        lines.append(f"# TYPE solution_cache_{name}_total counter")
+        lines.append(f"solution_cache_{name}_total {cache[name]}")
+    lines.append("# TYPE solution_cache_size gauge")
+    lines.append(f"solution_cache_size {cache['size']}")
+    return "\n".join(lines) + "\n"
+
+
+def get_job(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job {job_id}")
+    return job
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: SolutionRequest | ColumnarSolutionRequest):
+    job = app.state.jobs.submit(request)
+    return job.status()
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job_status(job_id: str):
+    return get_job(job_id).status()
+
+
+@app.get("/api/jobs/{job_id}/events")
+def stream_job(job_id: str):
+    job = get_job(job_id)
+    return StreamingResponse(app.state.jobs.stream(job), media_type="text/event-stream")
+
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = get_job(job_id)
+    if job.state != DONE:
+        raise HTTPException(status_code=409, detail=job.status())
+    return job.result
+
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = get_job(job_id)
+    app.state.jobs.cancel(job)
+    return job.status()
@@ -1,5 +1,9 @@
 import numpy as np
-from pydantic import BaseModel, computed_field
+from collections import defaultdict
+from pydantic import BaseModel, computed_field, model_validator
+
+# Columns of the (N, 7) package arrays the metrics are computed on
+X1, Y1, Z1, X2, Y2, Z2, WEIGHT = range(7)
 
 
 class Vector:
@@ -68,122 +72,276 @@ class Request(BaseModel):
     uld_weight: float
     packages: list[RequestItem]
 
+    def items(self) -> np.ndarray:
+        return to_array(self.packages)
+
+
+class ItemColumns(BaseModel):
+    """
+    The packages of a plan as one list per field, which
+    is parsed straight into an (N, 7) array
+    """
+
+    x1: list[float]
+    y1: list[float]
+    z1: list[float]
+    x2: list[float]
+    y2: list[float]
+    z2: list[float]
+    weight: list[float]
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        if len({len(column) for column in self.columns()}) > 1:
+            raise ValueError("All the package columns must have the same length")
+        return self
+
+    def columns(self):
+        return [self.x1, self.y1, self.z1, self.x2, self.y2, self.z2, self.weight]
+
+    def to_array(self) -> np.ndarray:
+        return np.array(ItemColumns.columns(self), dtype=float).reshape(7, -1).T
+
+
+class ColumnarRequest(BaseModel):
+    uld_length: float
+    uld_width: float
+    uld_height: float
+    uld_weight: float
+    packages: ItemColumns
+
+    def items(self) -> np.ndarray:
+        return self.packages.to_array()
+
+
+def to_array(pkgs: list[RequestItem]) -> np.ndarray:
+    """
+    Returns the packages as an (N, 7) array of (x1, y1, z1, x2, y2, z2, weight)
+    """
+    return np.array(
+        [[pkg.x1, pkg.y1, pkg.z1, pkg.x2, pkg.y2, pkg.z2, pkg.weight] for pkg in pkgs],
+        dtype=float,
+    ).reshape(-1, 7)
+
 
 def get_volumetric_center(pkgs: list[RequestItem]) -> Vector:
-    V = 0
-    V_center = Vector(0, 0, 0)
+    return volumetric_center(to_array(pkgs))
+
+
+def moi_metric(req: Request) -> float:
+    return uld_moi(req.items(), req.uld_length, req.uld_width)
+
+
+def used_space(req: Request) -> float:
+    return uld_used_space(req.items(), req.uld_length, req.uld_width, req.uld_height)
+
+
+def pack_volume(req: Request) -> float:
+    return uld_pack_volume(req.items(), req.uld_length, req.uld_width, req.uld_height)
 
-    for pkg in pkgs:
-        V += pkg.volume
-        V_center = V_center.add(pkg.center.scale(pkg.volume))
+
+def used_weight(req: Request) -> float:
+    return uld_used_weight(req.items(), req.uld_weight)
+
+
+def stability(req: Request):
+    return uld_stability(req.items(), req.uld_length, req.uld_width, req.uld_height)
+
+
+def request_metrics(req: Request) -> dict:
+    """
+    Returns all the metrics of the ULD of the request, parsing its packages once
+    """
+    return uld_metrics(
+        req.items(), req.uld_length, req.uld_width, req.uld_height, req.uld_weight
+    )
+
+
+def ordered_sum(values: np.ndarray) -> float:
+    """
+    Sums the values from left to right like the builtin `sum`, unlike
+    `np.sum` which adds pairwise, so that the sums do not depend on how
+    numpy splits them, and the metrics match a per-package loop
+    """
+    if len(values) == 0:
+        return 0
+    return float(np.add.accumulate(values)[-1])
+
+
+def centers(items: np.ndarray) -> np.ndarray:
+    return (items[:, X2:WEIGHT] + items[:, X1:X2]) / 2
+
+
+def volumes(items: np.ndarray) -> np.ndarray:
+    size = items[:, X2:WEIGHT] - items[:, X1:X2]
+    return size[:, 0] * size[:, 1] * size[:, 2]
+
+
+def volumetric_center(items: np.ndarray) -> Vector:
+    V = ordered_sum(volumes(items))
+    moment = centers(items) * volumes(items)[:, None]
+    V_center = Vector(*(ordered_sum(moment[:, i]) for i in range(3)))
 
     if V == 0:
         return V_center
     return V_center.scale(1 / V)
 
 
-def moi_metric(req: Request) -> float:
-    pkgs = req.packages
-    V_center = get_volumetric_center(pkgs)
-    MOI_MIN = 0
-
-    MOI_CORNERS = [0 for _ in range(4)]
-    corners = [
-        (0, 0),
-        (req.uld_length, 0),
-        (0, req.uld_width),
-        (req.uld_length, req.uld_width),
-    ]
+def squares(values: np.ndarray) -> np.ndarray:
+    """
+    Squares the values with the builtin `** 2`, which calls `pow`. numpy
+    squares arrays with a multiplication instead, which is off by one in
+    the last bit for some values
+    """
+    return np.array([value**2 for value in values.tolist()], dtype=float)
+
 
-    for pkg in pkgs:
-        MOI_MIN += pkg.weight * pkg.center.distanceZ(V_center)
-        for i, corner in enumerate(corners):
-            MOI_CORNERS[i] += pkg.weight * pkg.center.distance_2d(*corner)
+def squared_distances(center: np.ndarray, x: float, y: float) -> np.ndarray:
+    """
+    Returns the squared distances of the centers to (x, y) on the floor
+    """
+    return squares(center[:, 0] - x) + squares(center[:, 1] - y)
+
+
+def uld_moi(items: np.ndarray, length: float, width: float) -> float:
+    V_center = volumetric_center(items)
+    center = centers(items)
+    weight = items[:, WEIGHT]
+
+    MOI_MIN = ordered_sum(weight * squared_distances(center, V_center.x, V_center.y))
+
+    corners = [(0, 0), (length, 0), (0, width), (length, width)]
+    MOI_CORNERS = [
+        ordered_sum(weight * squared_distances(center, x, y)) for x, y in corners
+    ]
 
     if MOI_MIN == 0:
         return 0
     return (np.mean(MOI_CORNERS) + np.std(MOI_CORNERS)) / MOI_MIN
 
 
-def used_space(req: Request) -> float:
-    if req.uld_height == 0 or req.uld_width == 0 or req.uld_length == 0:
+def total_volume(items: np.ndarray) -> float:
+    return ordered_sum(volumes(items))
+
+
+def uld_used_space(
+    items: np.ndarray, length: float, width: float, height: float
+) -> float:
+    if height == 0 or width == 0 or length == 0:
         return 0
 
-    return sum(pkg.volume for pkg in req.packages) / (
-        req.uld_length * req.uld_width * req.uld_height
-    )
+    return total_volume(items) / (length * width * height)
 
 
-def pack_volume(req: Request) -> float:
-    if req.uld_height == 0 or req.uld_width == 0 or req.uld_length == 0:
+def uld_pack_volume(
+    items: np.ndarray, length: float, width: float, height: float
+) -> float:
+    if height == 0 or width == 0 or length == 0:
         return 0
 
-    return 0.5 * (
-        req.uld_length * req.uld_width * req.uld_height
-        - sum(pkg.volume for pkg in req.packages)
-    )
+    return 0.5 * (length * width * height - total_volume(items))
 
 
-def used_weight(req: Request) -> float:
-    if req.uld_weight == 0:
+def uld_used_weight(items: np.ndarray, capacity: float) -> float:
+    if capacity == 0:
         return 0
-    return sum(pkg.weight for pkg in req.packages) / req.uld_weight
+    return ordered_sum(items[:, WEIGHT]) / capacity
+
+
+def stacked_weights(items: np.ndarray) -> np.ndarray:
+    """
+    Returns for every package the total weight of the packages lying below
+    it, ie. the ones overlapping it on x and y whose top is at most its
+    bottom.
+
+    The packages are swept by their bottoms. Packages enter a grid over
+    the x/y footprints once the sweep reaches their top, so a package is
+    only checked against the packages of the grid sharing a cell with its
+    footprint, ie. the ones below it and close to it on the floor. The
+    weights are added in the original order of the packages.
+    """
+    n = len(items)
+    stacked = np.zeros(n)
+    if n == 0:
+        return stacked
+
+    size = items[:, X2:Z2] - items[:, X1:Z1]
+    cell_size = float(size.mean())
+    if cell_size <= 0:
+        cell_size = 1.0
+    lo = np.floor(items[:, X1:Z1] / cell_size).astype(int).tolist()
+    hi = np.floor(items[:, X2:Z2] / cell_size).astype(int).tolist()
+
+    def footprint(idx):
+        (cx1, cy1), (cx2, cy2) = lo[idx], hi[idx]
+        return [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
+
+    grid = defaultdict(list)
+    by_top = np.argsort(items[:, Z2], kind="stable").tolist()
+    tops = items[by_top, Z2]
+    entered = 0
+
+    for idx in np.argsort(items[:, Z1], kind="stable").tolist():
+        x1, y1, z1, x2, y2, _, _ = items[idx]
+        reached = int(np.searchsorted(tops, z1, side="right"))
+        for other in by_top[entered:reached]:
+            for cell in footprint(other):
+                grid[cell].append(other)
+        entered = reached
+
+        near = set()
+        for cell in footprint(idx):
+            near.update(grid.get(cell, ()))
+        if not near:
+            continue
+
+        below = np.array(sorted(near))
+        others = items[below]
+        mask = (
+            (others[:, X1] < x2)
+            & (others[:, X2] > x1)
+            & (others[:, Y1] < y2)
+            & (others[:, Y2] > y1)
+        )
+        stacked[idx] = ordered_sum(others[mask, WEIGHT])
 
+    return stacked
 
-def stability(req: Request):
-    if len(req.packages) == 0:
-        return 0
 
-    base_support_area = 0
-    center_of_gravity_height = 0
-    stacking_stability = 0
-    weighted_x_sum = 0
-    weighted_y_sum = 0
+def uld_stability(items: np.ndarray, length: float, width: float, height: float):
+    if len(items) == 0:
+        return 0
 
-    total_weight = sum(pkg.weight for pkg in req.packages)
+    size = items[:, X2:WEIGHT] - items[:, X1:X2]
+    center = centers(items)
+    weight = items[:, WEIGHT]
+    total_weight = ordered_sum(weight)
 
-    for pkg in req.packages:
-        mx_base_area = max(
-            pkg.length * pkg.width,
-            pkg.length * pkg.height,
-            pkg.width * pkg.height,
-        )
-        base_support_area += pkg.length * pkg.width / mx_base_area
+    mx_base_area = np.maximum(
+        np.maximum(size[:, 0] * size[:, 1], size[:, 0] * size[:, 2]),
+        size[:, 1] * size[:, 2],
+    )
+    base_support_area = ordered_sum(size[:, 0] * size[:, 1] / mx_base_area)
 
-        center_of_gravity_height += (
-            (pkg.z1 + pkg.z2) / 2 / req.uld_height * (pkg.weight / total_weight)
-        )
+    center_of_gravity_height = ordered_sum(
+        (items[:, Z1] + items[:, Z2]) / 2 / height * (weight / total_weight)
+    )
 
-        weighted_x_sum += pkg.center.x * pkg.weight
-        weighted_y_sum += pkg.center.y * pkg.weight
+    weighted_x_sum = ordered_sum(center[:, 0] * weight)
+    weighted_y_sum = ordered_sum(center[:, 1] * weight)
 
     # Stacking stability: penalize heavier packages on lighter ones
-    for pkg in req.packages:
-        below_packages = [
-            other
-            for other in req.packages
-            if (
-                other.x1 < pkg.x2
-                and other.x2 > pkg.x1
-                and other.y1 < pkg.y2
-                and other.y2 > pkg.y1
-                and other.z2 <= pkg.z1
-            )
-        ]
-        stacked_weight = sum(other.weight for other in below_packages)
-        stacking_stability += 1 if stacked_weight >= pkg.weight else 0
-
-    base_support_area /= len(req.packages)
-    stacking_stability /= len(req.packages)
+    stacking_stability = int(np.count_nonzero(stacked_weights(items) >= weight))
+
+    base_support_area /= len(items)
+    stacking_stability /= len(items)
 
     center_x = weighted_x_sum / total_weight
     center_y = weighted_y_sum / total_weight
     deviation_from_center = (
-        (center_x - req.uld_length / 2) ** 2 + (center_y - req.uld_width / 2) ** 2
+        (center_x - length / 2) ** 2 + (center_y - width / 2) ** 2
     ) ** 0.5
-    placement_distribution = 1 - (
-        deviation_from_center / ((req.uld_length + req.uld_width) / 4)
-    )
+    placement_distribution = 1 - (deviation_from_center / ((length + width) / 4))
 
     return (
         0.2 * base_support_area
@@ -191,3 +349,130 @@ def stability(req: Request):
         + 0.5 * placement_distribution
         + 0.1 * stacking_stability
     ) + 0.08
+
+
+def uld_metrics(
+    items: np.ndarray, length: float, width: float, height: float, capacity: float
+) -> dict:
+    """
+    Returns all the metrics of one ULD, as reported by /api/metrics
+    """
+    return {
+        "moi": uld_moi(items, length, width),
+        "count": len(items),
+        "utilization": uld_used_space(items, length, width, height),
+        "weight_utilization": uld_used_weight(items, capacity),
+        "stability": uld_stability(items, length, width, height),
+        "pack_volume": uld_pack_volume(items, length, width, height),
+    }
+
+
+class PlanULD(BaseModel):
+    id: str
+    length: float
+    width: float
+    height: float
+    weight: float
+
+
+class PlanItem(BaseModel):
+    uld_id: str
+    x1: float
+    y1: float
+    z1: float
+    x2: float
+    y2: float
+    z2: float
+    weight: float
+
+
+class PlanRequest(BaseModel):
+    ulds: list[PlanULD]
+    packages: list[PlanItem]
+
+    @model_validator(mode="after")
+    def check_uld_ids(self):
+        ids = {uld.id for uld in self.ulds}
+        for uid in self.owners():
+            if uid not in ids:
+                raise ValueError(f"Unknown ULD {uid}")
+        return self
+
+    def owners(self) -> list[str]:
+        return [pkg.uld_id for pkg in self.packages]
+
+    def items(self) -> np.ndarray:
+        return to_array(self.packages)
+
+
+class PlanItemColumns(ItemColumns):
+    uld_id: list[str]
+
+    def columns(self):
+        return super().columns() + [self.uld_id]
+
+
+class ColumnarPlanRequest(PlanRequest):
+    packages: PlanItemColumns
+
+    def owners(self) -> list[str]:
+        return self.packages.uld_id
+
+    def items(self) -> np.ndarray:
+        return self.packages.to_array()
+
+
+class Plan:
+    """
+    A columnar view of a whole loading plan, parsed once: the packages as an
+    (N, 7) array with the rows of every ULD kept contiguous, in the order
+    they were sent in.
+    """
+
+    def __init__(self, req: PlanRequest):
+        self.uld_ids = [uld.id for uld in req.ulds]
+        self.dims = np.array(
+            [[uld.length, uld.width, uld.height, uld.weight] for uld in req.ulds],
+            dtype=float,
+        ).reshape(-1, 4)
+
+        uld_index = {uid: idx for idx, uid in enumerate(self.uld_ids)}
+        owner = np.array([uld_index[uid] for uid in req.owners()], dtype=int)
+        order = np.argsort(owner, kind="stable")
+
+        self.items = req.items()[order]
+        self.bounds = np.searchsorted(owner[order], np.arange(len(self.uld_ids) + 1))
+
+    def uld_items(self, idx):
+        """
+        Returns the packages of the ULD at `idx` as an (N, 7) array
+        """
+        return self.items[self.bounds[idx] : self.bounds[idx + 1]]
+
+
+def plan_metrics(req: PlanRequest) -> dict:
+    """
+    Returns the metrics of every ULD of the plan, and the metrics of the
+    plan as a whole. The totals pool the volumes and the weights of all
+    the ULDs, while the moment and the stability are averaged over the
+    ULDs holding at least one package.
+    """
+    plan = Plan(req)
+
+    per_uld = []
+    for idx, uid in enumerate(plan.uld_ids):
+        metrics = uld_metrics(plan.uld_items(idx), *plan.dims[idx].tolist())
+        per_uld.append({"uld_id": uid, **metrics})
+
+    capacity = float((plan.dims[:, 0] * plan.dims[:, 1] * plan.dims[:, 2]).sum())
+    loaded = [metrics for metrics in per_uld if metrics["count"] > 0]
+    total = {
+        "moi": float(np.mean([m["moi"] for m in loaded])) if loaded else 0,
+        "count": len(plan.items),
+        "utilization": total_volume(plan.items) / capacity if capacity else 0,
+        "weight_utilization": uld_used_weight(plan.items, float(plan.dims[:, 3].sum())),
+        "stability": float(np.mean([m["stability"] for m in loaded])) if loaded else 0,
+        "pack_volume": sum(metrics["pack_volume"] for metrics in per_uld),
+    }
+
+    return {"ulds": per_uld, "total": total}
@@ -1,9 +1,29 @@
 import time
 import random
 import pandas as pd
-from pydantic import BaseModel, computed_field
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, computed_field, model_validator
+from core.cache import SolutionCache
 from core.genetic import GeneticSolver
 from core.manager import PackageManager
+from core.problem import ProblemContext
+from core.profiler import Profiler
+
+# Parameters the genetic solver is run with in every mode a request can
+# ask for, these are part of the key of the cached solutions. The classic
+# mode breeds one offspring per generation and answers quickly, the BRKGA
+# mode evaluates a whole population every generation, which takes tens
+# of times longer, and is meant for the requests which can wait, eg. the
+# jobs or the requests with a deadline. With a deadline the search is not
+# bounded by generations or stagnation, see `solver_params`
+SOLVER_PARAMS = {
+    "classic": {"mode": "classic", "cnt_genes": 500},
+    "brkga": {"mode": "brkga", "cnt_genes": 500, "pop_size": 12, "max_stagnation": 10},
+}
+
+# Share of the deadline kept for building the solution from the placements
+# of the solver, the solver gets the rest
+POST_PROCESS_SHARE = 0.05
 
 
 class Package(BaseModel):
@@ -32,6 +52,74 @@ class Request(BaseModel):
     packages: list[Package]
     ulds: list[ULD]
     mock: bool = True
+    # Search mode of the genetic solver, see `SOLVER_PARAMS`. Defaults to
+    # brkga with a deadline and to classic otherwise
+    mode: Optional[Literal["classic", "brkga"]] = None
+    # Time budget of the solve, the best solution found by then is returned.
+    # It covers the search and building the solution, not parsing the
+    # request, and at least one configuration is always evaluated, so a
+    # budget below one evaluation is overrun
+    deadline_ms: Optional[int] = Field(default=None, gt=0)
+
+    def columns(self):
+        """
+        Returns the packages and the ULDs to solve as dictionaries from the
+        field names to one list of values per field
+        """
+        return (
+            {
+                field: [getattr(pkg, field) for pkg in self.packages]
+                for field in Package.model_fields
+            },
+            {
+                field: [getattr(uld, field) for uld in self.ulds]
+                for field in ULD.model_fields
+            },
+        )
+
+
+class Columns(BaseModel):
+    @model_validator(mode="after")
+    def check_lengths(self):
+        if len({len(column) for column in self.__dict__.values()}) > 1:
+            raise ValueError("All the columns must have the same length")
+        return self
+
+
+class PackageColumns(Columns):
+    id: list[str]
+    length: list[float]
+    width: list[float]
+    height: list[float]
+    weight: list[float]
+    cost: list[float]
+    priority: list[bool]
+
+
+class ULDColumns(Columns):
+    id: list[str]
+    length: list[float]
+    width: list[float]
+    height: list[float]
+    weight: list[float]
+
+
+class ColumnarRequest(BaseModel):
+    """
+    The same problem as `Request`, with the packages and the ULDs sent as
+    one list per field instead of one object each, which is much cheaper
+    to parse for large manifests
+    """
+
+    packages: PackageColumns
+    ulds: ULDColumns
+    mock: bool = True
+    mode: Optional[Literal["classic", "brkga"]] = None
+    # Same mode and budget as in `Request`
+    deadline_ms: Optional[int] = Field(default=None, gt=0)
+
+    def columns(self):
+        return dict(self.packages), dict(self.ulds)
 
 
 def get_cached_solution():
@@ -39,20 +127,140 @@ def get_cached_solution():
     return df.to_dict(orient="records")
 
 
-def generate_solution(req: Request):
+def export_records(pkg_ids, uld_ids, mng: PackageManager):
+    """
+    Builds the placement records of the solution in the loading order,
+    with the ids of the packages and the ULDs
+    """
+    records = []
+    for pid in mng.get_results():
+        row = mng.package_wise_data[pid]
+        records.append(
+            {
+                "uld_id": uld_ids[row[1]],
+                "pack_id": pkg_ids[row[0]],
+                "x1": row[2],
+                "y1": row[3],
+                "z1": row[4],
+                "x2": row[5],
+                "y2": row[6],
+                "z2": row[7],
+            }
+        )
+    return records
+
+
+def export_blocking(pkg_ids, mng: PackageManager):
+    """
+    Returns the ids of the packages which must be loaded before every
+    package, in the loading order
+    """
+    return {
+        pkg_ids[pid]: [pkg_ids[dep] for dep in deps]
+        for pid, deps in mng.get_blocking_sets().items()
+    }
+
+
+def solver_params(req: Request):
+    """
+    Returns the parameters the genetic solver is run with for the request.
+    With a deadline the search keeps breeding until the deadline instead of
+    stopping after a number of generations or on stagnation, so a larger
+    budget is spent on improving the solution.
+    """
+    mode = req.mode
+    if mode is None:
+        mode = "classic" if req.deadline_ms is None else "brkga"
+
+    params = dict(SOLVER_PARAMS[mode])
+    if req.deadline_ms is not None:
+        params.update(cnt_genes=None, max_stagnation=None)
+    return params
+
+
+def generate_solution(req: Request, callback=None):
+    """
+    Solves the request and returns the solution with the stats of the solve,
+    ie. the number of finished generations, the number of configurations
+    actually evaluated (the others reused a cached fitness), the fitness of
+    the solution, the packages blocking every package in the loading order
+    and the timings of the stages of the solve.
+    `callback` is passed on to the genetic solver to report the progress and
+    stop the search early.
+    """
+    profiler = Profiler()
     if req.mock:
         time.sleep(random.uniform(0.2, 1.5))
-        return get_cached_solution()
+        stats = {"generations": 0, "evaluations": 0, "fitness": None, "blocking": {}}
+        return get_cached_solution(), {**stats, "timings": profiler.to_dict()}
+
+    start = time.time()
+    with profiler.timer("solve"):
+        packages, ulds = req.columns()
+        problem = ProblemContext(packages, ulds)
+        time_limit = None
+        if req.deadline_ms is not None:
+            budget = req.deadline_ms / 1000 * (1 - POST_PROCESS_SHARE)
+            time_limit = max(0, budget - (time.time() - start))
+        solver = GeneticSolver(
+            problem,
+            callback=callback,
+            time_limit=time_limit,
+            profiler=profiler,
+            **solver_params(req),
+        )
+        base_solution = solver.run()
 
-    solver = GeneticSolver(req.packages, req.ulds)
-    base_solution = solver.run()
+        lis_u = [[uid, *size] for uid, size in enumerate(problem.uld_sizes)]
+        mng = PackageManager(
+            problem.pkg_cnt,
+            problem.uld_cnt,
+            None,
+            lis_u,
+            base_solution,
+            profiler=profiler,
+        )
+        solution = export_records(packages["id"], ulds["id"], mng)
+        blocking = export_blocking(packages["id"], mng)
 
-    mng = PackageManager(
-        len(req.packages),
-        len(req.ulds),
-        base_solution.uld_order,
-        base_solution.pack_order,
-        base_solution.alloted,
+    stats = {
+        "generations": solver.generations,
+        "evaluations": profiler.counters["evaluations"],
+        "fitness": float(solver.best_fitness),
+        "blocking": blocking,
+    }
+    return solution, {**stats, "timings": profiler.to_dict()}
+
+
+def solution_key(req: Request):
+    """
+    Returns the key of the request in the solution cache, or None for mock
+    requests, which are not cached
+    """
+    if req.mock:
+        return None
+
+    packages, ulds = req.columns()
+    return SolutionCache.key(
+        packages, ulds, {**solver_params(req), "deadline_ms": req.deadline_ms}
     )
 
-    return mng.get_results()
+
+def solve_cached(req: Request, cache: SolutionCache):
+    """
+    Solves the request unless its solution is cached, and returns the
+    solution, the stats of the solve and whether it was a hit (None for
+    mock requests, which are not cached)
+    """
+    key = solution_key(req)
+    if key is None:
+        solution, stats = generate_solution(req)
+        return solution, stats, None
+
+    cached = cache.get(key)
+    if cached is not None:
+        return cached["solution"], cached["stats"], True
+
+    solution, stats = generate_solution(req)
+    cache.put(key, {"solution": solution, "stats": stats})
+    return solution, stats, False